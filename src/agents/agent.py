@@ -1,12 +1,14 @@
 import abc
-import base64
-from io import BytesIO
-from PIL import Image
+import asyncio
+import sys
 from typing import Any, Sequence
 
 from domain.request import AgentPredictionResponse
+from screenshot import ImageCodec, Screenshot, ScreenshotDedupe
 from utils import VIEWPORT_SIZE
 
+SCREEN_UNCHANGED_TEXT = "The screen did not change since the previous screenshot."
+
 
 class Agent(abc.ABC):
 
@@ -16,34 +18,37 @@ class Agent(abc.ABC):
             max_images_in_history: int = 5,
             image_size: tuple[int, int] = (1920, 1080),
             screen_size: tuple[int, int] = VIEWPORT_SIZE,
+            image_codec: ImageCodec = None,
+            screenshot_dedupe: ScreenshotDedupe = "off",
     ):
         self.name = name
         self.max_images_in_history = max_images_in_history
         self.image_size = image_size
         self.screen_size = screen_size
+        self.image_codec = image_codec or ImageCodec()
+        self.screenshot_dedupe = screenshot_dedupe
 
         self.history = []
         self.step = 1
+        self._previous_screenshot = None
 
-    def resize_screenshot(self, screenshot: str):
+    def resize_screenshot(self, screenshot: str | Screenshot):
         """
         Resize the screenshot to fit the agent's defined size
-        :param screenshot: base64 encoded screenshot
+        :param screenshot: base64 encoded screenshot or Screenshot
         :return: resized base64 encoded screenshot given self.image_size
         """
-        if VIEWPORT_SIZE == self.image_size:
-            return screenshot
-
-        img_bytes = base64.b64decode(screenshot)
-        img = Image.open(BytesIO(img_bytes))
+        screenshot = Screenshot.of(screenshot)
+        size = None if VIEWPORT_SIZE == self.image_size else self.image_size
+        return screenshot.to_base64(size=size, **self.image_codec.options())
 
+    def screenshot_mime_type(self, screenshot: str | Screenshot) -> str:
+        """Mime type of the screenshot as encoded by resize_screenshot / screenshot_data_url"""
+        return Screenshot.of(screenshot).mime_type(self.image_codec.format)
 
-        img = img.resize(self.image_size, Image.Resampling.LANCZOS)
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-
-        resized_b64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        return resized_b64
+    def screenshot_data_url(self, screenshot: str | Screenshot, size: tuple[int, int] = None) -> str:
+        """Data URL of the screenshot encoded with the agent's image codec (cached on the screenshot)"""
+        return Screenshot.of(screenshot).data_url(size=size, **self.image_codec.options())
 
     def resize_coords_to_original(self, coords: Sequence[float]) -> tuple[int, int]:
         """
@@ -103,13 +108,42 @@ class Agent(abc.ABC):
     def predict(self, screenshot: str, task, python_output: dict = None, terminal_output: dict = None) -> AgentPredictionResponse:
         pass
 
+    async def apredict(self, screenshot: str, task) -> AgentPredictionResponse:
+        """
+        Async variant of predict, used by the REST routes.
+        Agents without a native async implementation fall back to running predict in a worker thread.
+        """
+        return await asyncio.to_thread(self.predict, screenshot, task)
+
     @abc.abstractmethod
     def end_task(self, task_id: str = None):
         pass
 
+    def close(self):
+        """Stop background work of the agent (e.g. prefetched calls), called when it is replaced or evicted."""
+        pass
+
     def reset(self):
         self.history = []
         self.step = 1
+        self._previous_screenshot = None
+
+    def dedupe_screenshot(self, screenshot: str | Screenshot) -> tuple[Screenshot, bool]:
+        """
+        Compare the screenshot with the one of the previous step, if screenshot_dedupe is enabled.
+        :return: (screenshot, unchanged) - if unchanged, the previous Screenshot (with its cached encodings) is returned
+        """
+        screenshot = Screenshot.of(screenshot)
+        previous = self._previous_screenshot
+        unchanged = (
+            self.screenshot_dedupe != "off"
+            and previous is not None
+            and screenshot.is_visually_identical(previous)
+        )
+        if unchanged:
+            screenshot = previous
+        self._previous_screenshot = screenshot
+        return screenshot, unchanged
 
     def get_config(self):
         # Return a JSON-friendly snapshot of the agent's attributes.
@@ -119,6 +153,76 @@ class Agent(abc.ABC):
         config.pop("history", None)
         return _json_friendly(config)
 
+    def estimate_memory(self) -> dict:
+        """
+        Rough estimate of the memory held by the agent's history.
+        Base64/data-url images are counted as screenshot bytes, everything else as history bytes.
+        """
+        usage = {"history_bytes": 0, "screenshot_bytes": 0, "screenshots": 0}
+        seen = set()
+        _accumulate_memory(self.history, usage, seen)
+        for screenshot in (getattr(self, "last_screenshot", None), self._previous_screenshot):
+            if screenshot is not None:
+                _accumulate_memory(screenshot, usage, seen, key="screenshot")
+        return usage
+
+    def get_metrics(self) -> dict:
+        """JSON-friendly runtime metrics of the agent, e.g. request sizes. Empty unless the agent tracks any."""
+        return {}
+
+
+def estimate_size(value: Any) -> dict:
+    """history_bytes, screenshot_bytes and screenshots of a value (e.g. one history item), as in estimate_memory."""
+    usage = {"history_bytes": 0, "screenshot_bytes": 0, "screenshots": 0}
+    _accumulate_memory(value, usage, set())
+    return usage
+
+
+# keys under which agents keep (base64) images in their history
+_IMAGE_KEYS = ("screenshot", "image_url", "data", "url")
+_MIN_IMAGE_BYTES = 1024
+
+
+def _accumulate_memory(value: Any, usage: dict, seen: set, key: str = None, _depth: int = 0):
+    if _depth > 12 or id(value) in seen:
+        return
+    seen.add(id(value))
+
+    if isinstance(value, Screenshot):
+        usage["screenshot_bytes"] += value.nbytes
+        usage["screenshots"] += 1
+        return
+
+    if isinstance(value, (str, bytes)):
+        is_image = (
+            (isinstance(value, str) and value.startswith("data:image/"))
+            or (key in _IMAGE_KEYS and len(value) >= _MIN_IMAGE_BYTES)
+        )
+        if is_image:
+            usage["screenshot_bytes"] += len(value)
+            usage["screenshots"] += 1
+        else:
+            usage["history_bytes"] += len(value)
+        return
+
+    if isinstance(value, dict):
+        for k, v in list(value.items()):
+            _accumulate_memory(v, usage, seen, key=k if isinstance(k, str) else None, _depth=_depth + 1)
+        return
+
+    if isinstance(value, (list, tuple, set)):
+        for item in list(value):
+            _accumulate_memory(item, usage, seen, key=key, _depth=_depth + 1)
+        return
+
+    # response objects of the model clients (pydantic models) keep their fields in __dict__
+    attributes = getattr(value, "__dict__", None)
+    if isinstance(attributes, dict):
+        _accumulate_memory(attributes, usage, seen, key=key, _depth=_depth + 1)
+        return
+
+    usage["history_bytes"] += sys.getsizeof(value)
+
 
 _SKIP = object()
 
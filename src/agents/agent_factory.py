@@ -1,9 +1,31 @@
 from agents.agent import Agent
 from agents.base_models.anthropic.claude_agent import BaseAnthropicAgent, SkillAnthropicAgent
 from agents.hybrid.skill_agent_2.skill_agent_2 import SkillAgent2
+from screenshot import ImageCodec, ScreenshotDedupe
 
 
-def build_agent(agent_type: str, vm_http_server: str = None, max_images_in_history: int = None) -> Agent:
+def build_agent(
+        agent_type: str,
+        vm_http_server: str = None,
+        max_images_in_history: int = None,
+        image_codec: ImageCodec = None,
+        screenshot_dedupe: ScreenshotDedupe = None,
+        speculative_planning: bool = None,
+        response_chaining: bool = None,
+) -> Agent:
+    agent = _build_agent(agent_type, vm_http_server=vm_http_server, max_images_in_history=max_images_in_history)
+    if image_codec is not None:
+        agent.image_codec = image_codec
+    if screenshot_dedupe is not None:
+        agent.screenshot_dedupe = screenshot_dedupe
+    if speculative_planning is not None and hasattr(agent, "speculative_planning"):
+        agent.speculative_planning = speculative_planning
+    if response_chaining is not None and hasattr(agent, "response_chaining"):
+        agent.response_chaining = response_chaining
+    return agent
+
+
+def _build_agent(agent_type: str, vm_http_server: str = None, max_images_in_history: int = None) -> Agent:
     if agent_type == "anthropic-claude-sonnet-4.5":
         return BaseAnthropicAgent(model="claude-sonnet-4.5", http_server=vm_http_server)
     elif agent_type == "claude-haiku-4.5":
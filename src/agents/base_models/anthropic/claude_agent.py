@@ -1,19 +1,22 @@
+import asyncio
 from datetime import datetime
 import json
 import os
 import traceback
+from uuid import uuid4
 
-from fastapi import requests
 from loguru import logger
 from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
-from agents.agent import Agent
-from agents.hybrid.skill_agent_2.skill_book import SkillBook
+from agents.agent import SCREEN_UNCHANGED_TEXT, Agent
+from agents.hybrid.skill_agent_2.skill_book import get_skill_book_store
 from domain.request import AgentPredictionResponse, TokenUsage
+from screenshot import Screenshot
 
-from anthropic import AnthropicBedrock
+from anthropic import AnthropicBedrock, AsyncAnthropicBedrock
 
 from utils import expect_env_var
+from vm_client import get_vm_client
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -146,6 +149,7 @@ class BaseAnthropicAgent(Agent):
     def __init__(self, model: str, http_server: str, max_images_in_history: int = 5, image_size = (1280, 720), **kwargs):
         self.model = model
         self.http_server = http_server
+        self.kernel_id = str(uuid4())  # python interpreter of this agent on the VM, in kernel mode
 
         super().__init__(
             name=f"anthropic-{model}", 
@@ -157,6 +161,7 @@ class BaseAnthropicAgent(Agent):
         expect_env_var("AWS_ACCESS_KEY_ID")
         expect_env_var("AWS_SECRET_ACCESS_KEY")
         self.client = AnthropicBedrock(aws_region="eu-central-1")
+        self.async_client = AsyncAnthropicBedrock(aws_region="eu-central-1")
 
         self.inference_model = _ANTHROPIC_MODEL_MAP.get(self.model)
         self.history = []
@@ -200,6 +205,18 @@ class BaseAnthropicAgent(Agent):
         retry=retry_if_exception(_is_retriable_anthropic_error),
     )
     def _make_call(self, messages: list, max_tokens=10000):
+        return self.client.beta.messages.create(**self._call_kwargs(messages, max_tokens))
+
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(4),
+        wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0),
+        retry=retry_if_exception(_is_retriable_anthropic_error),
+    )
+    async def _amake_call(self, messages: list, max_tokens=10000):
+        return await self.async_client.beta.messages.create(**self._call_kwargs(messages, max_tokens))
+
+    def _call_kwargs(self, messages: list, max_tokens: int) -> dict:
         thinking = None
         if self.thinking_enabled:
             thinking = {
@@ -207,7 +224,7 @@ class BaseAnthropicAgent(Agent):
                 "budget_tokens": 6000,
             }
 
-        return self.client.beta.messages.create(
+        return dict(
             max_tokens=max_tokens,
             model=self.inference_model,
             thinking=thinking,
@@ -229,12 +246,17 @@ class BaseAnthropicAgent(Agent):
             if i > 0: 
                 content.extend(self.history[i-1].get("tool_results", []))
 
-            if i >= first_image_idx:
+            if i >= first_image_idx and ele.get("screen_unchanged"):
+                content.append({
+                    "type": "text",
+                    "text": SCREEN_UNCHANGED_TEXT,
+                })
+            elif i >= first_image_idx:
                 content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
+                        "media_type": ele.get("media_type", "image/png"),
                         "data": ele["screenshot"],
                     },
                 })
@@ -260,21 +282,45 @@ class BaseAnthropicAgent(Agent):
     def end_task(self, task_id: str = None):
         pass
 
-    def predict(self, screenshot: str, task: str) -> AgentPredictionResponse:
+    def close(self):
+        if self.http_server:
+            get_vm_client(self.http_server).stop_kernel(self.kernel_id)
+
+    def _prepare_messages(self, screenshot: str, task: str) -> list:
         user_query = None
         if len(self.history) == 0:
             user_query = task
 
-        screenshot = self.resize_screenshot(screenshot)
-        self.history.append({
-            "screenshot": screenshot,
-            "user_query": user_query,
-        })
+        screenshot, unchanged = self.dedupe_screenshot(screenshot)
+        if unchanged and self.screenshot_dedupe == "text":
+            self.history.append({
+                "screen_unchanged": True,
+                "user_query": user_query,
+            })
+        else:
+            # for an unchanged screen this is the (cached) encoding of the previous screenshot
+            self.history.append({
+                "screenshot": self.resize_screenshot(screenshot),
+                "media_type": self.screenshot_mime_type(screenshot),
+                "user_query": user_query,
+            })
 
         messages = self._build_messages()
         self._inject_prompt_caching(messages)
+        return messages
 
+    def predict(self, screenshot: str, task: str) -> AgentPredictionResponse:
+        messages = self._prepare_messages(screenshot, task)
         response = self._make_call(messages)
+        return self._handle_response(response)
+
+    async def apredict(self, screenshot: str, task: str) -> AgentPredictionResponse:
+        # resizing the screenshot is CPU bound, tool calls may block on the VM http server
+        messages = await asyncio.to_thread(self._prepare_messages, screenshot, task)
+        response = await self._amake_call(messages)
+        return await asyncio.to_thread(self._handle_response, response)
+
+    def _handle_response(self, response) -> AgentPredictionResponse:
         self.history[-1]["response"] = response.content
 
         tool_results = []
@@ -574,15 +620,8 @@ class BaseAnthropicAgent(Agent):
             if code.startswith(prefix):
                 code = code[len(prefix):].strip()
 
-        payload = json.dumps({"code": code})
-
         try:
-            response = requests.post(self.http_server + "/run_python", headers={'Content-Type': 'application/json'},
-                                        data=payload, timeout=300)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"status": "error", "message": "Failed to execute command.", "output": None, "error": response.json()["error"]}
+            return get_vm_client(self.http_server).run_python(code, kernel_id=self.kernel_id)
         except Exception as e:
             logger.error(f"An error occurred while trying to execute the command: {traceback.format_exc()}")
             raise e
@@ -593,40 +632,8 @@ class BaseAnthropicAgent(Agent):
         wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0)
     )
     def _execute_terminal_command(self, command: str, timeout: int = 300) -> dict:
-        payload = json.dumps({
-            "script": command,
-            "timeout": timeout
-        })
         try:
-            response = requests.post(
-                self.http_server + "/run_bash_script", 
-                headers={'Content-Type': 'application/json'},
-                data=payload, 
-                timeout=timeout,
-            )
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Bash script executed successfully with return code: {result.get('returncode', -1)}")
-                return result
-            elif response.status_code == 400:
-                return {
-                    "status": "error",
-                    "output": "",
-                    "error": f"Scipt execution failed with status code : {response.status_code}, error: {response.text}",
-                    "returncode": -1
-                }
-            else:
-                logger.error(f"Failed to execute bash script. Status code: {response.status_code}, response: {response.text}")
-                raise Exception("Failed to execute bash script.")
-            
-        except requests.exceptions.ReadTimeout:
-            logger.error("Bash script execution timed out")
-            return {
-                "status": "error",
-                "output": "",
-                "error": f"Script execution timed out after {timeout} seconds",
-                "returncode": -1
-            }
+            return get_vm_client(self.http_server).run_bash_script(command, timeout=timeout)
         except Exception as e:
             logger.error(f"An error occurred while trying to execute the bash script: {e}")
             raise e
@@ -737,7 +744,7 @@ You have access to a skillbook containing proven guidance from past agents—non
 class SkillAnthropicAgent(BaseAnthropicAgent):
     def __init__(self, model, http_server, max_images_in_history = 5, image_size=(1280, 720), **kwargs):
         super().__init__(model, http_server, max_images_in_history, image_size, **kwargs)
-        self.skill_book = SkillBook.load()
+        self.skill_book = get_skill_book_store().snapshot()
         self.system_prompt = SKILLS_PROMPT.format(
             dt=datetime.today().strftime('%A, %B %d, %Y'),
             domains_list=self.skill_book.list_domains(),
@@ -5,7 +5,7 @@ import base64
 import shutil
 from pathlib import Path
 from tenacity import retry, stop_after_attempt, wait_exponential
-from agents.agent import Agent
+from agents.agent import SCREEN_UNCHANGED_TEXT, Agent
 from datetime import datetime
 import os
 
@@ -16,6 +16,7 @@ from agents.base_models.qwen_3_vl.prompts import (
 from agents.base_models.qwen_3_vl.tools import ComputerUse, ExecutePythonCode, ExecuteTerminalCommand, GetDomainSkills, ReadSkills
 from agents.base_models.qwen_3_vl import utils as qwen_utils
 from domain.request import AgentPredictionResponse, TokenUsage
+from screenshot import Screenshot
 
 from utils import VIEWPORT_SIZE, expect_env_var, map_coords_to_screen
 
@@ -158,10 +159,35 @@ class QwenAgent(Agent):
     def end_task(self, task_id: str):
         pass
 
-    def predict(self, screenshot: str, task: str) -> AgentPredictionResponse:
-        self.history.append({
-            "screenshot": screenshot,
-        })
+    def close(self):
+        python_tool = getattr(self, "python_tool", None)
+        if python_tool is not None:
+            python_tool.close()
+
+    @staticmethod
+    def _screenshot_content(step: dict) -> dict | None:
+        """Image content of the step's screenshot, a text note if the screen was unchanged, None if it was dropped"""
+        if step.get("screen_unchanged"):
+            return {"type": "text", "text": SCREEN_UNCHANGED_TEXT}
+        if not step.get("screenshot"):
+            return None
+        return {
+            "type": "image_url",
+            "image_url": {"url": f"data:{step.get('media_type', 'image/png')};base64,{step['screenshot']}"},
+        }
+
+    def predict(self, screenshot: str | Screenshot, task: str) -> AgentPredictionResponse:
+        screenshot, unchanged = self.dedupe_screenshot(screenshot)
+        if unchanged and self.screenshot_dedupe == "text":
+            self.history.append({
+                "screen_unchanged": True,
+            })
+        else:
+            self.history.append({
+                # the image is sent as is (not resized), only re-encoded if the agent's codec asks for it
+                "screenshot": screenshot.to_base64(**self.image_codec.options()),
+                "media_type": self.screenshot_mime_type(screenshot),
+            })
         self._clean_history_from_images()
 
         resized_height, resized_width = qwen_utils.smart_resize(
@@ -215,11 +241,9 @@ class QwenAgent(Agent):
                     user_content.append({"type": "text", "text": "\n".join(tool_response_parts)})
 
                 # Screenshot (if still in memory after cleanup)
-                if self.history[i].get("screenshot"):
-                    user_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{self.history[i]['screenshot']}"},
-                    })
+                screenshot_content = self._screenshot_content(self.history[i])
+                if screenshot_content is not None:
+                    user_content.append(screenshot_content)
 
                 # Instruction prompt attached to the first message in the window
                 if idx == 0:
@@ -246,10 +270,7 @@ class QwenAgent(Agent):
                     tool_response_parts.append(f"<tool_response>\n{tr['content']}\n</tool_response>")
                 current_user_content.append({"type": "text", "text": "\n".join(tool_response_parts)})
 
-            current_user_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{self.history[current_step_idx]['screenshot']}"},
-            })
+            current_user_content.append(self._screenshot_content(self.history[current_step_idx]))
 
             messages.append({"role": "user", "content": current_user_content})
         else:
@@ -257,10 +278,7 @@ class QwenAgent(Agent):
             messages.append({
                 "role": "user",
                 "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{self.history[current_step_idx]['screenshot']}"},
-                    },
+                    self._screenshot_content(self.history[current_step_idx]),
                     {"type": "text", "text": instruction_prompt},
                 ],
             })
@@ -371,8 +389,8 @@ class SkillQwenAgent(QwenAgent):
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
 
-        from agents.hybrid.skill_agent_2.skill_book import SkillBook
-        self.skill_book = SkillBook.load()
+        from agents.hybrid.skill_agent_2.skill_book import get_skill_book_store
+        self.skill_book = get_skill_book_store().snapshot()
 
         self.system_prompt = QWEN_SKILLS_PROMPT.format(
             dt=datetime.today().strftime('%A, %B %d, %Y'),
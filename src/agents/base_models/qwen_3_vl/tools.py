@@ -1,12 +1,14 @@
 import json
 import traceback
 from typing import Union, List, Iterable, Sequence
+from uuid import uuid4
 
 from loguru import logger
-import requests
 from tenacity import retry, stop_after_attempt, wait_exponential
 from qwen_agent.tools.base import BaseTool, register_tool
 
+from vm_client import get_vm_client
+
 # https://github.com/QwenLM/Qwen3-VL/blob/main/cookbooks/utils/agent_function_call.py
 
 @register_tool("computer_use")
@@ -354,8 +356,12 @@ class ExecutePythonCode(BaseTool):
 
     def __init__(self, cfg=None):
         self.http_server = cfg["http_server"]
+        self.kernel_id = str(uuid4())  # python interpreter of this tool on the VM, in kernel mode
         super().__init__(cfg)
 
+    def close(self):
+        get_vm_client(self.http_server).stop_kernel(self.kernel_id)
+
     @retry(reraise=True, stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0))
     def call(self, params: Union[str, dict], **kwargs) -> str:
         params = self._verify_json_format_args(params)
@@ -366,18 +372,8 @@ class ExecutePythonCode(BaseTool):
             if code.startswith(prefix):
                 code = code[len(prefix):].strip()
 
-        payload = json.dumps({"code": code})
         try:
-            response = requests.post(
-                self.http_server + "/run_python",
-                headers={"Content-Type": "application/json"},
-                data=payload,
-                timeout=300,
-            )
-            if response.status_code == 200:
-                result = response.json()
-            else:
-                result = {"status": "error", "message": "Failed to execute command.", "output": None, "error": response.json().get("error")}
+            result = get_vm_client(self.http_server).run_python(code, kernel_id=self.kernel_id)
         except Exception as e:
             logger.error(f"Error executing python code: {traceback.format_exc()}")
             raise e
@@ -415,36 +411,8 @@ class ExecuteTerminalCommand(BaseTool):
         command = params["command"]
         timeout = 300
 
-        payload = json.dumps({"script": command, "timeout": timeout})
         try:
-            response = requests.post(
-                self.http_server + "/run_bash_script",
-                headers={"Content-Type": "application/json"},
-                data=payload,
-                timeout=timeout,
-            )
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Bash script executed successfully with return code: {result.get('returncode', -1)}")
-                return json.dumps(result, indent=2)
-            elif response.status_code == 400:
-                return json.dumps({
-                    "status": "error",
-                    "output": "",
-                    "error": f"Script execution failed with status code: {response.status_code}, error: {response.text}",
-                    "returncode": -1,
-                }, indent=2)
-            else:
-                logger.error(f"Failed to execute bash script. Status code: {response.status_code}, response: {response.text}")
-                raise Exception("Failed to execute bash script.")
-        except requests.exceptions.ReadTimeout:
-            logger.error("Bash script execution timed out")
-            return json.dumps({
-                "status": "error",
-                "output": "",
-                "error": f"Script execution timed out after {timeout} seconds",
-                "returncode": -1,
-            }, indent=2)
+            return json.dumps(get_vm_client(self.http_server).run_bash_script(command, timeout=timeout), indent=2)
         except Exception as e:
             logger.error(f"Error executing bash script: {e}")
             raise e
\ No newline at end of file
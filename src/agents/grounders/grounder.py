@@ -1,13 +1,19 @@
 import abc
-import base64
-import io
+import asyncio
+import os
 from typing import Tuple
 
-from PIL import Image
 from loguru import logger
 
+from agents.grounders.grounding_cache import GroundingCache, get_grounding_cache
+
+from screenshot import Screenshot
 from utils import VIEWPORT_SIZE
 
+GROUNDING_TWO_STAGE = os.getenv("GROUNDING_TWO_STAGE", "false").lower() == "true"
+_COARSE_SIZE = (640, 360)  # a ninth of the pixels of a 1920x1080 screenshot
+_CROP_SIZE = (640, 360)  # viewport pixels around the coarse point, sent at full resolution
+
 
 class GroundingError(Exception):
     """Raised when the grounder cannot extract coordinates from the LLM response."""
@@ -15,53 +21,185 @@ class GroundingError(Exception):
 
 
 class Grounder(abc.ABC):
-    def __init__(self, image_size: Tuple[int, int] = None, action_space_size: Tuple[int, int] = None):
+    """
+    Locates UI elements described in natural language and returns their viewport coordinates.
+
+    In two-stage mode, the element is first located coarsely on the screenshot downscaled to `coarse_size`,
+    then refined on a full-resolution crop of `crop_size` viewport pixels around the coarse point. Both
+    images together have far fewer pixels than the full screenshot, and small elements appear larger in the crop.
+
+    Results are cached per (screenshot, element description, grounder), by default in the process-wide cache.
+    """
+
+    def __init__(
+        self,
+        image_size: Tuple[int, int] = None,
+        action_space_size: Tuple[int, int] = None,
+        two_stage: bool = None,
+        coarse_size: Tuple[int, int] = _COARSE_SIZE,
+        crop_size: Tuple[int, int] = _CROP_SIZE,
+        cache: GroundingCache = None,
+    ):
         self.image_size = image_size if image_size else VIEWPORT_SIZE
         self.action_space_size = action_space_size if action_space_size else image_size
+        # a fixed action space means the model predicts normalized coordinates, whatever the image size
+        self.normalized_coords = action_space_size is not None
+        self.two_stage = GROUNDING_TWO_STAGE if two_stage is None else two_stage
+        self.coarse_size = coarse_size
+        self.crop_size = crop_size
+        self.cache = cache if cache is not None else get_grounding_cache()
+
+    @property
+    def cache_id(self) -> str:
+        """Identifies the grounder configuration in cache keys, results of different configurations may differ."""
+        mode = f"two-stage {self.coarse_size} {self.crop_size}" if self.two_stage else f"single {self.image_size}"
+        return f"{type(self).__name__}:{getattr(self, 'model', '')}:{mode}"
 
-    def _resize_image(self, screenshot: str) -> str:
-        """Resize base64 encoded image to self.image_size and return resized base64 image."""
+    def _resize_image(self, screenshot: str | Screenshot) -> str:
+        """Resize the screenshot to self.image_size and return it base64 encoded (cached on the screenshot)."""
+        screenshot = Screenshot.of(screenshot)
         if VIEWPORT_SIZE == self.image_size:
-            return screenshot
-        image_bytes = base64.b64decode(screenshot)
-        
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Resize to target size
-        resized_image = image.resize(self.image_size, Image.Resampling.LANCZOS)
-        
-        # Convert back to base64
-        buffer = io.BytesIO()
-        resized_image.save(buffer, format=image.format or "PNG")
-        resized_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        
-        return resized_base64
-
-    def _resize_coords_to_viewport(self, pred_coords: tuple[int, int]) -> tuple[int, int]:
+            return screenshot.base64
+        return screenshot.to_base64(size=self.image_size)
+
+    def _resize_coords_to_viewport(
+        self,
+        pred_coords: tuple[int, int],
+        region: tuple[int, int, int, int] = None,
+        image_size: tuple[int, int] = None,
+    ) -> tuple[int, int]:
+        """
+        Map coordinates predicted on an image to the viewport.
+        :param region: (left, top, width, height) of the viewport shown in the image, defaults to the whole viewport
+        :param image_size: pixel size the image was sent at, defaults to self.image_size
+        """
         x, y = pred_coords
-        
+        left, top, width, height = region if region else (0, 0, *VIEWPORT_SIZE)
+        action_space_size = self.action_space_size
+        if not self.normalized_coords and (region or image_size):
+            action_space_size = image_size if image_size else (width, height)
+
         # Calculate scale factors
-        scale_x = VIEWPORT_SIZE[0] / self.action_space_size[0]
-        scale_y = VIEWPORT_SIZE[1] / self.action_space_size[1]
-        
-        # Scale coordinates back to viewport
-        viewport_x = int(x * scale_x)
-        viewport_y = int(y * scale_y)
-        
+        scale_x = width / action_space_size[0]
+        scale_y = height / action_space_size[1]
+
+        # Scale coordinates back to viewport and add the offset of the region
+        viewport_x = left + int(x * scale_x)
+        viewport_y = top + int(y * scale_y)
+
         return (viewport_x, viewport_y)
-    
-    def locate_ui_element_coords(self, screenshot: str, ui_element: str) -> tuple[int, int]:
+
+    def _crop_region(self, center: tuple[int, int]) -> tuple[int, int, int, int]:
+        """(left, top, width, height) of the crop_size region around center, shifted to lie inside the viewport."""
+        width, height = min(self.crop_size[0], VIEWPORT_SIZE[0]), min(self.crop_size[1], VIEWPORT_SIZE[1])
+        left = min(max(center[0] - width // 2, 0), VIEWPORT_SIZE[0] - width)
+        top = min(max(center[1] - height // 2, 0), VIEWPORT_SIZE[1] - height)
+        return left, top, width, height
+
+    def _crop(self, screenshot: Screenshot, region: tuple[int, int, int, int]) -> str:
+        """The region (in viewport pixels) of the screenshot at full resolution, base64 encoded."""
+        left, top, width, height = region
+        scale_x = screenshot.size[0] / VIEWPORT_SIZE[0]
+        scale_y = screenshot.size[1] / VIEWPORT_SIZE[1]
+        box = (int(left * scale_x), int(top * scale_y), int((left + width) * scale_x), int((top + height) * scale_y))
+        return screenshot.crop(box).base64
+
+    def locate_ui_element_coords(self, screenshot: str | Screenshot, ui_element: str) -> tuple[int, int]:
+        screenshot = Screenshot.of(screenshot)
+        key = self.cache.key(screenshot, ui_element, self.cache_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Grounding cache hit {cached} for element '{ui_element}'")
+            return cached, (0, 0)
+        resized_coords, usage = self._locate(screenshot, ui_element)
+        self.cache.put(key, resized_coords)
+        return resized_coords, usage
+
+    async def alocate_ui_element_coords(self, screenshot: str | Screenshot, ui_element: str) -> tuple[int, int]:
+        screenshot = Screenshot.of(screenshot)
+        # the perceptual hash decodes the screenshot on first use, keep that off the event loop
+        key = await asyncio.to_thread(self.cache.key, screenshot, ui_element, self.cache_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Grounding cache hit {cached} for element '{ui_element}'")
+            return cached, (0, 0)
+        resized_coords, usage = await self._alocate(screenshot, ui_element)
+        self.cache.put(key, resized_coords)
+        return resized_coords, usage
+
+    def _locate(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        """Locate without the cache, returns (viewport coords, token usage)."""
+        if self.two_stage:
+            return self._locate_two_stage(screenshot, ui_element)
+        return self._locate_single(screenshot, ui_element)
+
+    async def _alocate(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        if self.two_stage:
+            return await self._alocate_two_stage(screenshot, ui_element)
+        return await self._alocate_single(screenshot, ui_element)
+
+    def _locate_single(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
         resized_image = self._resize_image(screenshot)
         coords, usage = self._locate_ui_element_coords_raw(resized_image, ui_element)
         logger.info(f"Grounder localized {coords} for element '{ui_element}'")
         resized_coords = self._resize_coords_to_viewport(coords)
         logger.info(f"Resized coords to viewport: {resized_coords}")
         return resized_coords, usage
-    
 
-    @abc.abstractmethod
+    async def _alocate_single(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        resized_image = self._resize_image(screenshot)
+        coords, usage = await self._alocate_ui_element_coords_raw(resized_image, ui_element)
+        logger.info(f"Grounder localized {coords} for element '{ui_element}'")
+        resized_coords = self._resize_coords_to_viewport(coords)
+        logger.info(f"Resized coords to viewport: {resized_coords}")
+        return resized_coords, usage
+
+    def _locate_two_stage(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        coarse_image = screenshot.to_base64(size=self.coarse_size)
+        coarse_coords, coarse_usage = self._locate_ui_element_coords_raw(coarse_image, ui_element)
+        coarse_point = self._resize_coords_to_viewport(coarse_coords, image_size=self.coarse_size)
+        logger.info(f"Grounder coarsely localized {coarse_point} for element '{ui_element}'")
+
+        region = self._crop_region(coarse_point)
+        try:
+            coords, usage = self._locate_ui_element_coords_raw(self._crop(screenshot, region), ui_element)
+        except GroundingError as e:
+            logger.warning(f"Refining '{ui_element}' failed, using the coarse point: {e}")
+            return coarse_point, coarse_usage
+        return self._refined_coords(coords, region, ui_element), _add_usage(coarse_usage, usage)
+
+    async def _alocate_two_stage(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        coarse_image = await asyncio.to_thread(screenshot.to_base64, size=self.coarse_size)
+        coarse_coords, coarse_usage = await self._alocate_ui_element_coords_raw(coarse_image, ui_element)
+        coarse_point = self._resize_coords_to_viewport(coarse_coords, image_size=self.coarse_size)
+        logger.info(f"Grounder coarsely localized {coarse_point} for element '{ui_element}'")
+
+        region = self._crop_region(coarse_point)
+        try:
+            crop = await asyncio.to_thread(self._crop, screenshot, region)
+            coords, usage = await self._alocate_ui_element_coords_raw(crop, ui_element)
+        except GroundingError as e:
+            logger.warning(f"Refining '{ui_element}' failed, using the coarse point: {e}")
+            return coarse_point, coarse_usage
+        return self._refined_coords(coords, region, ui_element), _add_usage(coarse_usage, usage)
+
+    def _refined_coords(self, coords: tuple[int, int], region: tuple[int, int, int, int], ui_element: str) -> tuple[int, int]:
+        logger.info(f"Grounder localized {coords} in crop {region} for element '{ui_element}'")
+        resized_coords = self._resize_coords_to_viewport(coords, region=region)
+        logger.info(f"Resized coords to viewport: {resized_coords}")
+        return resized_coords
+
     def _locate_ui_element_coords_raw(self, screenshot: str, ui_element: str) -> tuple[int, int]:
-        pass    
+        """
+        Call the model on a base64 image, returns (coords in the action space, token usage). Model grounders
+        implement this, grounders overriding _locate and _alocate (see RoutingGrounder) do not need it.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not call a model itself")
+
+    async def _alocate_ui_element_coords_raw(self, screenshot: str, ui_element: str) -> tuple[int, int]:
+        """Async variant of _locate_ui_element_coords_raw. Falls back to a worker thread if not overridden."""
+        return await asyncio.to_thread(self._locate_ui_element_coords_raw, screenshot, ui_element)
 
 
+def _add_usage(a: tuple[int, int], b: tuple[int, int]) -> tuple[int, int]:
+    return a[0] + b[0], a[1] + b[1]
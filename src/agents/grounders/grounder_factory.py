@@ -0,0 +1,49 @@
+import os
+import threading
+
+from agents.grounders.grounder import Grounder
+from agents.grounders.local import LocalGrounder
+from agents.grounders.qwen3_vl import QWEN3_VL_DEFAULT_MODEL, Qwen3VLGrounder
+from agents.grounders.routing import RoutingGrounder
+
+# "local" grounds with a locally hosted server (see LocalGrounder) instead of OpenRouter
+GROUNDING_BACKEND = os.getenv("GROUNDING_BACKEND", "openrouter")
+# comma separated grounding models to hedge slow or failing grounding calls with, e.g. "qwen/qwen3-vl-235b-a22b-instruct"
+GROUNDING_FALLBACK_MODELS = [model.strip() for model in os.getenv("GROUNDING_FALLBACK_MODELS", "").split(",") if model.strip()]
+# budget of a routed backend: the router fails over instead of waiting for long retries
+GROUNDING_ROUTED_TIMEOUT = float(os.getenv("GROUNDING_ROUTED_TIMEOUT", "30"))
+GROUNDING_ROUTED_MAX_ATTEMPTS = int(os.getenv("GROUNDING_ROUTED_MAX_ATTEMPTS", "2"))
+
+_routers: dict[tuple[str, ...], RoutingGrounder] = {}
+_routers_lock = threading.Lock()
+
+
+def build_grounder(model: str = None) -> Grounder:
+    """
+    The grounder of a tool set: LocalGrounder with GROUNDING_BACKEND=local, else the OpenRouter Qwen3-VL grounder
+    of model (Qwen3VLGrounder's default if None), routed together with GROUNDING_FALLBACK_MODELS if any.
+    """
+    if GROUNDING_BACKEND == "local":
+        return LocalGrounder()
+    model = model or QWEN3_VL_DEFAULT_MODEL
+    if not GROUNDING_FALLBACK_MODELS:
+        return Qwen3VLGrounder(model=model)
+    return get_routing_grounder((model, *GROUNDING_FALLBACK_MODELS))
+
+
+def get_routing_grounder(models: tuple[str, ...]) -> RoutingGrounder:
+    """The router over the models, shared by all tool sets (and so all sessions) of the process."""
+    with _routers_lock:
+        if models not in _routers:
+            _routers[models] = RoutingGrounder([
+                Qwen3VLGrounder(model=model, max_attempts=GROUNDING_ROUTED_MAX_ATTEMPTS, timeout=GROUNDING_ROUTED_TIMEOUT)
+                for model in models
+            ])
+        return _routers[models]
+
+
+def routing_stats() -> dict[str, list[dict]]:
+    """Backend statistics of every router of the process."""
+    with _routers_lock:
+        routers = list(_routers.values())
+    return {router.cache_id: router.stats() for router in routers}
@@ -0,0 +1,67 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from screenshot import Screenshot
+
+GROUNDING_CACHE_SIZE = int(os.getenv("GROUNDING_CACHE_SIZE", "512"))
+
+
+class GroundingCache:
+    """
+    LRU cache of grounding results, keyed by the perceptual hash of the screenshot, the normalized
+    element description and the grounder configuration. Locating the same element on an unchanged
+    screen (a retry, a move followed by a click, a wait that changed nothing) is answered from memory.
+    """
+
+    def __init__(self, max_entries: int = GROUNDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str, str], tuple[int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(screenshot: Screenshot, ui_element: str, grounder: str) -> tuple[str, str, str]:
+        return screenshot.perceptual_hash(), normalize_description(ui_element), grounder
+
+    def get(self, key: tuple[str, str, str]) -> tuple[int, int] | None:
+        with self._lock:
+            coords = self._entries.get(key)
+            if coords is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return coords
+
+    def put(self, key: tuple[str, str, str], coords: tuple[int, int]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = coords
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def normalize_description(ui_element: str) -> str:
+    """Lowercase, collapse whitespace and drop surrounding quotes and punctuation."""
+    return re.sub(r"\s+", " ", ui_element).strip().strip("'\"`.,;:!?").strip().lower()
+
+
+_grounding_cache = GroundingCache()
+
+
+def get_grounding_cache() -> GroundingCache:
+    """The grounding cache shared by all grounders of the process."""
+    return _grounding_cache
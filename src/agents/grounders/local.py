@@ -0,0 +1,138 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from loguru import logger
+from openai.types.chat import ChatCompletion
+
+from agents.grounders.qwen3_vl import Qwen3VLGrounder
+
+LOCAL_GROUNDING_BASE_URL = os.getenv("LOCAL_GROUNDING_BASE_URL", "http://127.0.0.1:8000/v1")
+LOCAL_GROUNDING_MODEL = os.getenv("LOCAL_GROUNDING_MODEL", "Qwen/Qwen3-VL-32B-Instruct")
+LOCAL_GROUNDING_MAX_BATCH_SIZE = int(os.getenv("LOCAL_GROUNDING_MAX_BATCH_SIZE", "16"))
+LOCAL_GROUNDING_MAX_WAIT_MS = float(os.getenv("LOCAL_GROUNDING_MAX_WAIT_MS", "10"))
+_BATCHES_IN_FLIGHT = 4
+_TIMEOUT = (3.05, 120)  # (connect, read) seconds
+_RESULT_TIMEOUT = 2 * sum(_TIMEOUT)  # a request may wait for a batch in flight before its own is sent
+
+
+class GroundingBatcher:
+    """
+    Collects concurrent chat completion requests for one local server, from any thread or session,
+    and sends them as one batched inference call.
+
+    A batch is closed when it reaches max_batch_size or max_wait_ms after its first request arrived, so a lone
+    request waits at most max_wait_ms. Batches go to `POST {base_url}/chat/completions/batch` with body
+    `{"requests": [...]}` and answer `{"responses": [...]}`, one chat completion or `{"error": ...}` per request.
+    Servers without the batch endpoint (404) get the requests of a batch as concurrent single requests,
+    which servers with continuous batching (vLLM, llama.cpp) still run as one batch.
+    """
+
+    def __init__(self, base_url: str, max_batch_size: int = LOCAL_GROUNDING_MAX_BATCH_SIZE, max_wait_ms: float = LOCAL_GROUNDING_MAX_WAIT_MS):
+        self.base_url = base_url.rstrip("/")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_endpoint_supported = True
+        self._queue: queue.Queue[tuple[dict, Future]] = queue.Queue()
+        self._http = requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=_BATCHES_IN_FLIGHT * max_batch_size, thread_name_prefix="local-grounding")
+        self._collector = threading.Thread(target=self._collect, name="local-grounding-batcher", daemon=True)
+        self._collector.start()
+
+    def submit(self, request: dict) -> Future:
+        """Queue a chat completion request body, the future resolves to the response JSON."""
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: list[tuple[dict, Future]]):
+        if self.batch_endpoint_supported and len(batch) > 1:
+            try:
+                response = self._http.post(
+                    f"{self.base_url}/chat/completions/batch", json={"requests": [request for request, _ in batch]}, timeout=_TIMEOUT
+                )
+                if response.status_code == 404:
+                    logger.info(f"{self.base_url} has no batch endpoint, sending concurrent single requests")
+                    self.batch_endpoint_supported = False
+                else:
+                    response.raise_for_status()
+                    results = response.json()["responses"]
+                    for (_, future), result in zip(batch, results):
+                        if "error" in result:
+                            future.set_exception(RuntimeError(f"Local grounding server error: {result['error']}"))
+                        else:
+                            future.set_result(result)
+                    for _, future in batch[len(results):]:
+                        future.set_exception(RuntimeError(f"Local grounding server returned {len(results)} responses for {len(batch)} requests"))
+                    return
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        if len(batch) == 1:
+            self._send_single(*batch[0])
+        else:
+            for request, future in batch:
+                self._executor.submit(self._send_single, request, future)
+
+    def _send_single(self, request: dict, future: Future):
+        try:
+            response = self._http.post(f"{self.base_url}/chat/completions", json=request, timeout=_TIMEOUT)
+            response.raise_for_status()
+            future.set_result(response.json())
+        except Exception as e:
+            future.set_exception(e)
+
+
+_batchers: dict[str, GroundingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_grounding_batcher(base_url: str) -> GroundingBatcher:
+    """The batcher of a server, shared by all grounders (and so all sessions) of the process."""
+    with _batchers_lock:
+        if base_url not in _batchers:
+            _batchers[base_url] = GroundingBatcher(base_url)
+        return _batchers[base_url]
+
+
+class LocalGrounder(Qwen3VLGrounder):
+    """
+    Qwen3-VL grounder served by a locally hosted OpenAI-compatible server (vLLM, llama.cpp, ...),
+    for air-gapped runs or co-locating grounding with the REST service.
+    Concurrent requests of all sessions are micro-batched, see GroundingBatcher.
+    """
+
+    def __init__(self, model: str = LOCAL_GROUNDING_MODEL, base_url: str = LOCAL_GROUNDING_BASE_URL, two_stage: bool = None):
+        super().__init__(model=model, two_stage=two_stage, base_url=base_url, api_key="local")
+        self.batcher = get_grounding_batcher(self.base_url)
+
+    def _make_call(self, messages: list):
+        return ChatCompletion.model_validate(self.batcher.submit(self._request(messages)).result(timeout=_RESULT_TIMEOUT))
+
+    async def _amake_call(self, messages: list):
+        future = self.batcher.submit(self._request(messages))
+        return ChatCompletion.model_validate(await asyncio.wait_for(asyncio.wrap_future(future), timeout=_RESULT_TIMEOUT))
+
+    def _request(self, messages: list) -> dict:
+        return {"model": self.model, "messages": messages, "temperature": 0.0}
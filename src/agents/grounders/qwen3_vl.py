@@ -1,10 +1,11 @@
 import json
 import openai
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, wait_exponential
 from agents.grounders.grounder import Grounder, GroundingError
 from utils import convert_to_base64_image_url, expect_env_var
 
 _QWEN3_VL_ACTION_SPACE_SIZE = (1000, 1000)
+QWEN3_VL_DEFAULT_MODEL = "qwen/qwen3-vl-235b-a22b-instruct"
 _SYSTEM_PROMPT = """
 You are an AI model specialized in locating UI elements within screenshots. Given a GUI screenshot and a description of a UI element, your task is to accurately identify and return the (x, y) coordinates of the specified UI element within the image
 
@@ -23,18 +24,47 @@ User Query: 'Locate the "Submit" button on the screen.'
 Output: 'I see the blue "Submit" button at coordinates (450, 300)'.
 """
 
+def _stop_after_max_attempts(retry_state) -> bool:
+    return retry_state.attempt_number >= retry_state.args[0].max_attempts
+
+
 class Qwen3VLGrounder(Grounder):
-    def __init__(self, model: str = "qwen/qwen3-vl-235b-a22b-instruct"):
-        super().__init__(action_space_size=_QWEN3_VL_ACTION_SPACE_SIZE)
+    """
+    Qwen3-VL grounder on an OpenAI-compatible API (OpenRouter by default).
+    Calls are tried up to max_attempts times, each for at most timeout seconds if set (the client default otherwise).
+    """
+
+    def __init__(
+        self,
+        model: str = QWEN3_VL_DEFAULT_MODEL,
+        two_stage: bool = None,
+        base_url: str = None,
+        api_key: str = None,
+        max_attempts: int = 4,
+        timeout: float = None,
+    ):
+        # Qwen3-VL predicts coordinates normalized to 0-1000 on any image, so crops need no extra handling
+        super().__init__(action_space_size=_QWEN3_VL_ACTION_SPACE_SIZE, two_stage=two_stage)
         self.model = model
+        self.max_attempts = max_attempts
+        self.base_url = base_url or expect_env_var("OPENROUTER_BASE_URL")
+        api_key = api_key or expect_env_var("OPENROUTER_API_KEY")
+        # with a timeout, retrying is left to max_attempts only
+        client_options = {"timeout": timeout, "max_retries": 0} if timeout is not None else {}
         self.client = openai.OpenAI(
-            base_url=expect_env_var("OPENROUTER_BASE_URL"),
-            api_key=expect_env_var("OPENROUTER_API_KEY")
+            base_url=self.base_url,
+            api_key=api_key,
+            **client_options,
         )
-        
+        self.async_client = openai.AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=api_key,
+            **client_options,
+        )
+
     @retry(
        reraise=True,
-       stop=stop_after_attempt(4),
+       stop=_stop_after_max_attempts,
        wait=wait_exponential(multiplier=3.0, min=1.0, max=60.0),
     )
     def _make_call(self, messages: list):
@@ -45,6 +75,20 @@ class Qwen3VLGrounder(Grounder):
         if response is None:
             raise ValueError("No response from the grounding model.")
         return response
+
+    @retry(
+       reraise=True,
+       stop=_stop_after_max_attempts,
+       wait=wait_exponential(multiplier=3.0, min=1.0, max=60.0),
+    )
+    async def _amake_call(self, messages: list):
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+        )
+        if response is None:
+            raise ValueError("No response from the grounding model.")
+        return response
     
     # def _extract_tool_calls(self, text: str) -> list[dict]:
     #     blocks: list[str] = []
@@ -83,8 +127,8 @@ class Qwen3VLGrounder(Grounder):
         else:
             raise GroundingError(text)
     
-    def _locate_ui_element_coords_raw(self, screenshot: str, ui_element: str) -> tuple[int, int]:
-        messages = [
+    def _build_messages(self, screenshot: str, ui_element: str) -> list:
+        return [
             {
                 "role": "system",
                 "content": _SYSTEM_PROMPT
@@ -103,9 +147,18 @@ class Qwen3VLGrounder(Grounder):
                 ]
             }
         ]
-        response = self._make_call(messages)
+
+    def _parse_response(self, response) -> tuple[tuple[int, int], tuple[int, int]]:
         text = response.choices[0].message.content
         usage = (response.usage.prompt_tokens, response.usage.completion_tokens)
         coords = self._extract_coords_from_response(text)
         return coords, usage
+
+    def _locate_ui_element_coords_raw(self, screenshot: str, ui_element: str) -> tuple[int, int]:
+        response = self._make_call(self._build_messages(screenshot, ui_element))
+        return self._parse_response(response)
+
+    async def _alocate_ui_element_coords_raw(self, screenshot: str, ui_element: str) -> tuple[int, int]:
+        response = await self._amake_call(self._build_messages(screenshot, ui_element))
+        return self._parse_response(response)
     
\ No newline at end of file
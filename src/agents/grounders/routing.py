@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from loguru import logger
+
+from agents.grounders.grounder import Grounder, GroundingError
+from screenshot import Screenshot
+
+_EWMA_ALPHA = 0.2
+_LATENCY_WINDOW = 100  # latencies kept per backend for the hedge percentile
+_MIN_SAMPLES_FOR_PERCENTILE = 10
+_ERROR_PENALTY = 4.0  # a backend failing every call ranks like one 5x slower
+
+
+class _BackendStats:
+    """Latency and error statistics of one backend. Not thread-safe, guarded by the router's lock."""
+
+    def __init__(self):
+        self.latency_ewma: float | None = None
+        self.error_ewma = 0.0
+        self.latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.hedged = 0  # calls started as hedge for a slow backend
+
+    def record(self, latency: float, error: bool):
+        self.calls += 1
+        self.errors += int(error)
+        self.error_ewma += _EWMA_ALPHA * (float(error) - self.error_ewma)
+        if not error:
+            self.latencies.append(latency)
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += _EWMA_ALPHA * (latency - self.latency_ewma)
+
+    def score(self) -> float:
+        """Expected cost of a call, lower is better. Backends without samples come first, so they get measured."""
+        if self.latency_ewma is None:
+            return 0.0
+        return self.latency_ewma * (1 + _ERROR_PENALTY * self.error_ewma)
+
+    def percentile(self, q: float, default: float) -> float:
+        if len(self.latencies) < _MIN_SAMPLES_FOR_PERCENTILE:
+            return default
+        return float(np.percentile(self.latencies, q))
+
+
+class RoutingGrounder(Grounder):
+    """
+    Routes grounding requests over several backend grounders (different models or providers).
+
+    Each request goes to the backend with the best latency / error EWMA score. If it has not answered after
+    its p`hedge_percentile` latency (or `default_hedge_after` seconds until enough samples exist), or fails,
+    the request is also sent to the next best backend, and the first successful answer wins.
+    A GroundingError is only raised if all tried backends fail and at least one of them raised it.
+
+    Routers are meant to be long-lived and shared (see grounder_factory.get_routing_grounder), so the latency
+    statistics carry over between tasks and sessions. Backends should have a short timeout and few retries,
+    a backend retrying for long would hold an attempt slot instead of failing over.
+    """
+
+    def __init__(
+        self,
+        backends: list[Grounder],
+        hedge_percentile: float = 90,
+        default_hedge_after: float = 10.0,
+        max_attempts: int = 2,
+        **kwargs,
+    ):
+        if not backends:
+            raise ValueError("RoutingGrounder needs at least one backend")
+        # backends handle their own image sizes, action spaces and two-stage mode
+        super().__init__(two_stage=False, **kwargs)
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_after = default_hedge_after
+        self.max_attempts = max(1, min(max_attempts, len(backends)))
+        self._stats = [_BackendStats() for _ in backends]
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(backends), thread_name_prefix="grounding-router")
+
+    @property
+    def cache_id(self) -> str:
+        return "RoutingGrounder[" + ",".join(backend.cache_id for backend in self.backends) + "]"
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "backend": backend.cache_id,
+                    "latency_ewma": stats.latency_ewma,
+                    "error_ewma": stats.error_ewma,
+                    "hedge_after": stats.percentile(self.hedge_percentile, self.default_hedge_after),
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "hedged": stats.hedged,
+                }
+                for backend, stats in zip(self.backends, self._stats)
+            ]
+
+    def _ranked(self) -> list[int]:
+        with self._lock:
+            return sorted(range(len(self.backends)), key=lambda i: self._stats[i].score())
+
+    def _hedge_after(self, index: int) -> float:
+        with self._lock:
+            return self._stats[index].percentile(self.hedge_percentile, self.default_hedge_after)
+
+    def _record(self, index: int, start: float, error: bool, hedged: bool = False):
+        with self._lock:
+            self._stats[index].record(time.perf_counter() - start, error)
+            self._stats[index].hedged += int(hedged)
+
+    def _call(self, index: int, screenshot: Screenshot, ui_element: str, hedged: bool):
+        start = time.perf_counter()
+        try:
+            result = self.backends[index]._locate(screenshot, ui_element)
+        except Exception:
+            self._record(index, start, error=True, hedged=hedged)
+            raise
+        self._record(index, start, error=False, hedged=hedged)
+        return result
+
+    async def _acall(self, index: int, screenshot: Screenshot, ui_element: str, hedged: bool):
+        start = time.perf_counter()
+        try:
+            result = await self.backends[index]._alocate(screenshot, ui_element)
+        except asyncio.CancelledError:
+            # lost the race, says nothing about the backend
+            raise
+        except Exception:
+            self._record(index, start, error=True, hedged=hedged)
+            raise
+        self._record(index, start, error=False, hedged=hedged)
+        return result
+
+    def _locate(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        candidates = self._ranked()[:self.max_attempts]
+        pending = {}
+        errors = []
+        while True:
+            if candidates and len(pending) < self.max_attempts:
+                index = candidates.pop(0)
+                hedged = bool(pending or errors)
+                if hedged:
+                    logger.info(f"Hedging grounding of '{ui_element}' with {self.backends[index].cache_id}")
+                pending[self._executor.submit(self._call, index, screenshot, ui_element, hedged)] = index
+                hedge_after = self._hedge_after(index)
+            if not pending:
+                raise _combine_errors(errors)
+
+            # wait for the first answer, or until the newest backend is slower than usual and it is time to hedge
+            done, _ = wait(pending, timeout=hedge_after if candidates else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    # slower calls still running are left to finish in the background, their stats still count
+                    return future.result()
+                except Exception as e:
+                    logger.warning(f"Grounding backend {self.backends[index].cache_id} failed: {e!r}")
+                    errors.append(e)
+
+    async def _alocate(self, screenshot: Screenshot, ui_element: str) -> tuple[tuple[int, int], tuple[int, int]]:
+        candidates = self._ranked()[:self.max_attempts]
+        pending = {}
+        errors = []
+        try:
+            while True:
+                if candidates and len(pending) < self.max_attempts:
+                    index = candidates.pop(0)
+                    hedged = bool(pending or errors)
+                    if hedged:
+                        logger.info(f"Hedging grounding of '{ui_element}' with {self.backends[index].cache_id}")
+                    pending[asyncio.create_task(self._acall(index, screenshot, ui_element, hedged))] = index
+                    hedge_after = self._hedge_after(index)
+                if not pending:
+                    raise _combine_errors(errors)
+
+                done, _ = await asyncio.wait(pending, timeout=hedge_after if candidates else None, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.warning(f"Grounding backend {self.backends[index].cache_id} failed: {e!r}")
+                        errors.append(e)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _combine_errors(errors: list[Exception]) -> Exception:
+    """The error to raise once all backends failed: a GroundingError if any backend could not ground the element."""
+    grounding_errors = [e for e in errors if isinstance(e, GroundingError)]
+    return grounding_errors[-1] if grounding_errors else errors[-1]
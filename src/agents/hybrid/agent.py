@@ -1,3 +1,4 @@
+import asyncio
 import json
 from typing import Tuple
 from uuid import uuid4
@@ -5,12 +6,18 @@ from uuid import uuid4
 from loguru import logger
 import openai
 from tenacity import retry, stop_after_attempt, wait_exponential
-from agents.agent import Agent
+from agents.agent import SCREEN_UNCHANGED_TEXT, Agent
+from agents.hybrid.history_compactor import HistoryCompactor
 from agents.hybrid.prompts import PLANNER_SYSTEM_PROMPT, PLANNER_SYSTEM_PROMPT_V2
 from agents.hybrid.tools import CuaToolSet, CuaToolSetNativeLocalization
-from agents.grounders.qwen3_vl import Qwen3VLGrounder
+from agents.grounders.grounder_factory import build_grounder
 from domain.request import AgentPredictionResponse, TokenUsage
-from utils import expect_env_var, fix_pyautogui_script, get_openai_client, get_tool_calls_from_response
+from screenshot import Screenshot
+from utils import expect_env_var, fix_pyautogui_script, get_async_openai_client, get_openai_client, get_tool_calls_from_response
+
+# tools after which the next planner call is speculated on an unchanged screen (speculative planning). The coding
+# tools are not listed: they regenerate the plan within the step, so a step never ends with them alone
+_SPECULATION_TOOLS = {"press_keys", "wait"}
 
 
 class Custom1Agent(Agent):
@@ -18,6 +25,18 @@ class Custom1Agent(Agent):
     This uses a custom agent based on planning separately and GUI grounding for coordinate-based tasks
     
     Follows https://arxiv.org/pdf/2505.13227
+
+    With speculative_planning, a step whose tool calls are all non-visual (keys, wait)
+    pre-issues the next planner call as if the screen did not change, while the harness executes the actions.
+    If the next screenshot is visually identical to the previous one, the prefetched plan is used,
+    otherwise it is discarded. Only apredict speculates.
+
+    With response_chaining, planner calls only send the items added since the previous response together
+    with its previous_response_id, so the upload per step no longer grows with the history. Screenshots already
+    sent stay in the server-side state: once the chain holds more than twice max_images_in_history of them, the
+    old ones are replaced by placeholders and the history is replayed in full, starting a new chain. The same
+    happens once the chain exceeds PLANNER_HISTORY_MAX_TOKENS, if set (compacted on replay), or the server no
+    longer knows it (expired).
     """
 
     def __init__(self, name: str = "custom-1", max_images_in_history: int = None):
@@ -26,26 +45,58 @@ class Custom1Agent(Agent):
         self.grounding_model = "Qwen/Qwen3-VL-32B-Instruct"
         self.model = "gpt-5.2"
         self.planner_client = get_openai_client()
-        self.tool_set = CuaToolSet(
-            grounder=Qwen3VLGrounder(model=self.grounding_model),
-        )
+        self.async_planner_client = get_async_openai_client()
+        self.tool_set = self._build_tool_set()
         self.system_prompt = PLANNER_SYSTEM_PROMPT
         self.reasoning_effort = "high"
         self.max_images_in_history = max_images_in_history
         self.history = []
+        self.history_compactor = HistoryCompactor()
         self.prompt_cache_key = str(uuid4())
 
         # managing responses api state
         self.last_tool_results = []
         self.last_response_id = None
         self.last_screenshot = None
+        self.screen_unchanged = False
+
+        # speculative planning
+        self.speculative_planning = False
+        self.speculation_stats = {"started": 0, "used": 0, "discarded": 0}
+        self._last_tool_names = []
+        self._speculation: asyncio.Task | None = None
+        self._speculation_turn = None
+        self._speculation_history_length = None
+        self._speculation_request = None
+
+        # previous_response_id chaining
+        self.response_chaining = False
+        self._chain_length = None  # history items the server holds in the state of last_response_id
+        self._chain_images = 0  # screenshots in that state
+        self._chain_tokens = 0  # input tokens of the last response
     
+    def _build_tool_set(self) -> CuaToolSet:
+        """The tool set of the agent, built once in __init__ (subclasses override this instead of replacing it)."""
+        return CuaToolSet(grounder=build_grounder(self.grounding_model))
+
     def reset(self):
         super().reset()
         self.last_tool_results = None
         self.last_response_id = None
         self.last_screenshot = None
+        self.screen_unchanged = False
         self.history = []
+        self.history_compactor.reset()
+        self._last_tool_names = []
+        self._discard_speculation()
+        self._reset_chain()
+
+    def close(self):
+        self._discard_speculation()
+        self.tool_set.close()
+
+    def get_metrics(self) -> dict:
+        return {"history": self.history_compactor.metrics(), "speculation": dict(self.speculation_stats)}
 
     def _remove_screenshots_from_history(self, remove_all: bool = False):
         """
@@ -83,14 +134,9 @@ class Custom1Agent(Agent):
                 "text": "[Previous screenshot omitted]"
             }
 
-    @retry(
-       reraise=True,
-       stop=stop_after_attempt(4),
-       wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0),
-    )
-    def _generate_plan(self) -> Tuple[str, list]:
-
-        response = self.planner_client.responses.create(
+    def _plan_request(self, history: list = None) -> dict:
+        """Request of the next planner call on history (defaults to self.history), chained to the last response if possible."""
+        request = dict(
             model=self.model,
             # instructions=instructions,
             tools=self.tool_set.tools,
@@ -98,39 +144,125 @@ class Custom1Agent(Agent):
                 "effort": self.reasoning_effort,
                 "summary": "auto",
             },
-            input=self.history,
             prompt_cache_key=self.prompt_cache_key,
-            # previous_response_id=self.previous_response_id,
             tool_choice="required",
         )
+        chained_items = self._chained_items(self.history if history is None else history)
+        if chained_items is not None:
+            request["input"] = chained_items
+            request["previous_response_id"] = self.last_response_id
+        else:
+            if history is None:
+                if self.response_chaining:
+                    self._remove_screenshots_from_history()
+                history = self.history_compactor.compact(self.history)
+            request["input"] = history
+        return request
+
+    def _chained_items(self, history: list) -> list | None:
+        """Items of history the server has not seen yet, None if the request cannot be chained to the last response."""
+        if not self.response_chaining or self.last_response_id is None or self._chain_length is None:
+            return None
+        if len(history) < self._chain_length:
+            return None
+        items = history[self._chain_length:]
+        if self.max_images_in_history is not None and self._chain_images + _count_images(items) > 2 * self.max_images_in_history:
+            logger.info("Too many screenshots in the response chain, replaying the history without the oldest")
+            return None
+        if self.history_compactor.max_tokens and self._chain_tokens > self.history_compactor.max_tokens:
+            logger.info("Response chain exceeds the history budget, replaying the compacted history")
+            return None
+        return items
 
+    def _on_plan_response(self, request: dict, response):
+        # only requests whose plan is used are counted, not discarded speculations
+        self.history_compactor.record_request(request["input"])
         self.last_response_id = response.id
+        chained_images = self._chain_images if "previous_response_id" in request else 0
+        self._chain_images = chained_images + _count_images(request["input"])
+        usage = getattr(response, "usage", None)
+        self._chain_tokens = usage.input_tokens if usage is not None else 0
+
+    def _reset_chain(self):
+        self._chain_length = None
+        self._chain_images = 0
+        self._chain_tokens = 0
+
+    def _on_chain_expired(self, request: dict, error: Exception) -> dict | None:
+        """The request to retry with if the error says the chained response is gone, else None."""
+        if "previous_response_id" not in request or not _is_expired_response_error(error):
+            return None
+        logger.warning(f"Previous response {request['previous_response_id']} is no longer available, replaying the full history")
+        self._reset_chain()
+        return self._plan_request()
+
+    @retry(
+       reraise=True,
+       stop=stop_after_attempt(4),
+       wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0),
+    )
+    def _generate_plan(self) -> Tuple[str, list]:
+        request = self._plan_request()
+        try:
+            response = self.planner_client.responses.create(**request)
+        except openai.APIStatusError as e:
+            request = self._on_chain_expired(request, e)
+            if request is None:
+                raise
+            response = self.planner_client.responses.create(**request)
+        self._on_plan_response(request, response)
+        return response
+
+    @retry(
+       reraise=True,
+       stop=stop_after_attempt(4),
+       wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0),
+    )
+    async def _agenerate_plan(self) -> Tuple[str, list]:
+        request = self._plan_request()
+        try:
+            response = await self.async_planner_client.responses.create(**request)
+        except openai.APIStatusError as e:
+            request = self._on_chain_expired(request, e)
+            if request is None:
+                raise
+            response = await self.async_planner_client.responses.create(**request)
+        self._on_plan_response(request, response)
         return response
 
     def end_task(self, task_id: str = None):
         pass
 
-    def iterate(self, screenshot: str = None, task: str = None) -> tuple[AgentPredictionResponse, bool]:
+    def _append_user_turn(self, screenshot: Screenshot = None, task: str = None):
+        self.history.append(self._user_turn(screenshot=screenshot, task=task, screen_unchanged=self.screen_unchanged))
+
+    def _user_turn(self, screenshot: Screenshot = None, task: str = None, screen_unchanged: bool = False) -> dict:
         # prepare user input
         user_content = []
         # === Screenshot
-        if screenshot:
+        if screenshot and screen_unchanged and self.screenshot_dedupe == "text":
+            user_content.append({
+                "type": "input_text",
+                "text": SCREEN_UNCHANGED_TEXT
+            })
+        elif screenshot:
             user_content.append({
                 "type": "input_image",
-                "image_url": f"data:image/png;base64,{screenshot}"
+                # cached on the screenshot, an unchanged screen reuses the previous data url
+                "image_url": self.screenshot_data_url(screenshot)
             })
         # === User Query
         user_content.append({
             "type": "input_text", 
             "text": f"Complete the following task: '{task}'" if task else "Execute the next action (or finish if done/fail/infeasible)."
         })
-        self.history.append({
+        return {
             "role": "user",
             "content": user_content
-        })
+        }
 
-        response = self._generate_plan()
-        self.history += response.output
+    def _process_plan(self, response, tool_calls: list, parsed_actions: list) -> tuple[AgentPredictionResponse, bool]:
+        """Record the tool results of a plan in history and build the agent response from them."""
         regenerate_plan = False
 
         token_usage = TokenUsage.from_response(response)
@@ -145,16 +277,12 @@ class Custom1Agent(Agent):
         reasoning_summary = "\n\n".join(reasoning_summaries)
         logger.info(f"Reasoning Summary: {reasoning_summary}")
 
-        tool_calls = get_tool_calls_from_response(response)
         executed_actions = []
         pyautogui_scripts = []
         self.last_tool_results = []
 
-        for tool_call in tool_calls:
-            executed_action, pyautogui_script, _token_usage, _regenerate_plan = self.tool_set.parse_action(
-                tool_call=tool_call,
-                screenshot=self.last_screenshot,
-            )
+        for tool_call, parsed_action in zip(tool_calls, parsed_actions):
+            executed_action, pyautogui_script, _token_usage, _regenerate_plan = parsed_action
             regenerate_plan = _regenerate_plan or regenerate_plan
             
             token_usage.prompt_tokens += _token_usage[0]
@@ -191,9 +319,36 @@ class Custom1Agent(Agent):
             usage=token_usage,
         ), regenerate_plan
 
-    def predict(self, screenshot: str, task) -> AgentPredictionResponse:
-        task = task if self.step == 1 else None
+    def iterate(self, screenshot: Screenshot = None, task: str = None) -> tuple[AgentPredictionResponse, bool]:
+        self._append_user_turn(screenshot=screenshot, task=task)
+
+        response = self._generate_plan()
+        self.history += response.output
+        self._chain_length = len(self.history)
 
+        tool_calls = get_tool_calls_from_response(response)
+        parsed_actions = self.tool_set.parse_actions(tool_calls=tool_calls, screenshot=self.last_screenshot)
+        return self._process_plan(response, tool_calls, parsed_actions)
+
+    async def aiterate(self, screenshot: Screenshot = None, task: str = None, speculation: tuple = None) -> tuple[AgentPredictionResponse, bool]:
+        if speculation is not None:
+            # the prefetched plan was generated on exactly this user turn
+            user_turn, request, response = speculation
+            self.history.append(user_turn)
+            self._on_plan_response(request, response)
+        else:
+            # encoding the screenshot for the data url is CPU bound
+            await asyncio.to_thread(self._append_user_turn, screenshot=screenshot, task=task)
+            response = await self._agenerate_plan()
+        self.history += response.output
+        self._chain_length = len(self.history)
+
+        tool_calls = get_tool_calls_from_response(response)
+        self._last_tool_names = [tool_call.name for tool_call in tool_calls]
+        parsed_actions = await self.tool_set.aparse_actions(tool_calls=tool_calls, screenshot=self.last_screenshot)
+        return self._process_plan(response, tool_calls, parsed_actions)
+
+    def _start_step(self, screenshot: str):
         # System Prompt
         if len(self.history) == 0:
             self.history = [
@@ -203,8 +358,14 @@ class Custom1Agent(Agent):
                 }
             ]
         
-        self.last_screenshot = screenshot
-        agent_response, retrigger = self.iterate(screenshot=screenshot, task=task)
+        # shared by the planner history and the grounder, so the image is decoded at most once per step
+        self.last_screenshot, self.screen_unchanged = self.dedupe_screenshot(screenshot)
+
+    def predict(self, screenshot: str, task) -> AgentPredictionResponse:
+        task = task if self.step == 1 else None
+        self._start_step(screenshot)
+
+        agent_response, retrigger = self.iterate(screenshot=self.last_screenshot, task=task)
         while retrigger:
             logger.info("Regenerating plan based on tool call result.")
             additional_response, retrigger = self.iterate(screenshot=None, task=None)
@@ -213,14 +374,102 @@ class Custom1Agent(Agent):
 
         self.step += 1
         return agent_response
-    
+
+    async def apredict(self, screenshot: str, task) -> AgentPredictionResponse:
+        task = task if self.step == 1 else None
+        previous_screenshot = self.last_screenshot
+        # decoding and comparing the screenshot is CPU bound, keep it off the event loop shared by all sessions
+        await asyncio.to_thread(self._start_step, screenshot)
+        speculation = await self._take_speculation(previous_screenshot)
+
+        agent_response, retrigger = await self.aiterate(screenshot=self.last_screenshot, task=task, speculation=speculation)
+        while retrigger:
+            logger.info("Regenerating plan based on tool call result.")
+            additional_response, retrigger = await self.aiterate(screenshot=None, task=None)
+
+            agent_response += additional_response
+
+        self.step += 1
+        if self.speculative_planning and self._last_tool_names and set(self._last_tool_names) <= _SPECULATION_TOOLS:
+            self._start_speculation()
+        return agent_response
+
+    def _start_speculation(self):
+        """Pre-issue the planner call of the next step, predicting that the screen does not change."""
+        self._discard_speculation()
+        self._speculation_turn = self._user_turn(screenshot=self.last_screenshot, screen_unchanged=True)
+        self._speculation_history_length = len(self.history)
+        self._speculation_request = self._plan_request(history=[*self.history, self._speculation_turn])
+        self._speculation = asyncio.create_task(self.async_planner_client.responses.create(**self._speculation_request))
+        self.speculation_stats["started"] += 1
+        logger.info("Speculatively requested the next plan")
+
+    async def _take_speculation(self, previous_screenshot: Screenshot | None) -> tuple | None:
+        """The (user turn, request, response) of the speculated plan if it matches the new step, else None."""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        matches = (
+            previous_screenshot is not None
+            and len(self.history) == self._speculation_history_length
+            and await asyncio.to_thread(self.last_screenshot.is_visually_identical, previous_screenshot)
+        )
+        if not matches:
+            speculation.cancel()
+            self.speculation_stats["discarded"] += 1
+            logger.info("Screen changed, discarded the speculated plan")
+            return None
+        try:
+            response = await speculation
+        except Exception as e:
+            self.speculation_stats["discarded"] += 1
+            logger.warning(f"Speculated plan failed, planning again: {e!r}")
+            return None
+        self.speculation_stats["used"] += 1
+        logger.info("Screen unchanged, using the speculated plan")
+        return self._speculation_turn, self._speculation_request, response
+
+    def _discard_speculation(self):
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None and not speculation.done():
+            # may be called outside of the event loop running it
+            speculation.get_loop().call_soon_threadsafe(speculation.cancel)
+            self.speculation_stats["discarded"] += 1
+
+
+def _count_images(items: list) -> int:
+    return sum(
+        1
+        for item in items
+        if isinstance(item, dict) and isinstance(item.get("content"), list)
+        for content in item["content"]
+        if isinstance(content, dict) and content.get("type") == "input_image"
+    )
+
+
+def _is_expired_response_error(error: Exception) -> bool:
+    """Whether the API rejected a request because its previous_response_id is unknown (expired or not stored)."""
+    if isinstance(error, openai.NotFoundError):
+        return True
+    return isinstance(error, openai.BadRequestError) and (
+        getattr(error, "param", None) == "previous_response_id" or "previous response" in str(error).lower()
+    )
+
+
 class Custom2Agent(Custom1Agent):
     """ same custom-1, however has coding tools (python/terminal)"""
     def __init__(self, vm_http_server: str, name: str = "custom-2", max_images_in_history: int = None):
+        self.vm_http_server = vm_http_server
         super().__init__(name=name, max_images_in_history=max_images_in_history)
         self.system_prompt = PLANNER_SYSTEM_PROMPT_V2
-        self.grounder = Qwen3VLGrounder(model="qwen/qwen3-vl-32b-instruct")
-        self.tool_set = CuaToolSet(grounder=self.grounder, enable_python_execution_tool=True, enable_terminal_command_tool=True, http_server=vm_http_server)
+
+    def _build_tool_set(self) -> CuaToolSet:
+        return CuaToolSet(
+            grounder=build_grounder(model="qwen/qwen3-vl-32b-instruct"),
+            enable_python_execution_tool=True,
+            enable_terminal_command_tool=True,
+            http_server=self.vm_http_server,
+        )
     
 class Custom3Agent(Custom2Agent):
     """ same custom-2, with max 10 screenshots in memory """
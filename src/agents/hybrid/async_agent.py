@@ -5,14 +5,15 @@ from typing import Optional, Tuple
 from loguru import logger
 import requests
 from tenacity import retry
-from agents.grounders.qwen3_vl import Qwen3VLGrounder
+from agents.grounders.grounder_factory import build_grounder
 from agents.hybrid.agent import Custom2Agent
 from agents.hybrid.tools import CuaToolSet
+from screenshot import Screenshot
 
 class AsyncToolSet(CuaToolSet):
     def __init__(self, vm_http_server: str):
         super().__init__(
-            grounder=Qwen3VLGrounder(),
+            grounder=build_grounder(),
             http_server=vm_http_server,
             enable_python_execution_tool=True,
             enable_terminal_command_tool=True,
@@ -37,7 +38,7 @@ class AsyncToolSet(CuaToolSet):
             tool_result = [
                 {
                     "type": "input_image",
-                    "image_url": {"url": "data:image/png;base64," + screenshot},
+                    "image_url": {"url": Screenshot.of(screenshot).data_url()},
                 }
             ]
         else:
@@ -58,9 +59,11 @@ class AsyncCustomAgent(Custom2Agent):
 
     def __init__(self, vm_http_server: str, name: str = "async-custom-2"):
         super().__init__(name=name, vm_http_server=vm_http_server)
-        self.tool_set = AsyncToolSet(vm_http_server=vm_http_server)
         self.system_prompt += "\n* You have access to an additional tool 'screenshot' to take screenshots of the current screen whenever needed.*"
 
+    def _build_tool_set(self) -> AsyncToolSet:
+        return AsyncToolSet(vm_http_server=self.vm_http_server)
+
     def _generate_plan(self, task: str = None, screenshot: str = None) -> Tuple[str, list]: 
         screenshot = screenshot if self.step == 1 else None
         return super()._generate_plan(task=task, screenshot=screenshot)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import os
+
+from loguru import logger
+
+from agents.agent import estimate_size
+
+# token budget of the planner history, above which old steps are compacted (e.g. 150000). Compaction changes what
+# the planner sees on long tasks, so it is off (0) by default
+PLANNER_HISTORY_MAX_TOKENS = int(os.getenv("PLANNER_HISTORY_MAX_TOKENS", "0"))
+_IMAGE_TOKENS = 1500  # a 1920x1080 screenshot at high detail, roughly
+_BYTES_PER_TOKEN = 4
+_OMISSION_NOTE = "[{count} earlier steps were removed from the history to save context, their effects are visible on the current screen.]"
+
+
+class HistoryCompactor:
+    """
+    Keeps the Responses API history of the planner within a token budget and measures what is sent per call.
+
+    Compaction is opt-in: with max_tokens 0 (the default, see PLANNER_HISTORY_MAX_TOKENS) the history is only
+    measured. Tokens are estimated per item (text bytes / 4, a fixed amount per image). Once the history exceeds
+    max_tokens, it is compacted down to target_ratio of the budget, so the prefix stays stable (and cached)
+    for many steps between two compactions:
+    1. outputs of old tool calls longer than max_tool_output_chars are cut to their head,
+    2. then the oldest steps are dropped as a whole (user turn, reasoning, tool calls and their outputs, so no
+       call loses its output) and replaced by a single note.
+    The system prompt, the task turn and the last keep_recent_turns user turns are never touched.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = PLANNER_HISTORY_MAX_TOKENS,
+        target_ratio: float = 0.75,
+        keep_recent_turns: int = 4,
+        max_tool_output_chars: int = 2000,
+    ):
+        self.max_tokens = max_tokens
+        self.target_ratio = target_ratio
+        self.keep_recent_turns = keep_recent_turns
+        self.max_tool_output_chars = max_tool_output_chars
+        self.reset()
+
+    def reset(self):
+        self.omitted_turns = 0
+        self._metrics = {
+            "requests": 0,
+            "last_request_bytes": 0,
+            "max_request_bytes": 0,
+            "total_request_bytes": 0,
+            "last_request_tokens": 0,
+            "compactions": 0,
+            "truncated_tool_outputs": 0,
+            "omitted_turns": 0,
+        }
+
+    def metrics(self) -> dict:
+        requests = self._metrics["requests"]
+        return {
+            **self._metrics,
+            "bytes_per_request": self._metrics["total_request_bytes"] // requests if requests else 0,
+        }
+
+    def record_request(self, history: list):
+        """Count the bytes and estimated tokens of a request input."""
+        sizes = [estimate_size(item) for item in history]
+        request_bytes = sum(size["history_bytes"] + size["screenshot_bytes"] for size in sizes)
+        self._metrics["requests"] += 1
+        self._metrics["last_request_bytes"] = request_bytes
+        self._metrics["max_request_bytes"] = max(self._metrics["max_request_bytes"], request_bytes)
+        self._metrics["total_request_bytes"] += request_bytes
+        self._metrics["last_request_tokens"] = sum(_tokens(size) for size in sizes)
+
+    def compact(self, history: list) -> list:
+        """Compact the history in place if it exceeds the budget, returns it."""
+        if not self.max_tokens:
+            return history
+        tokens = [_tokens(estimate_size(item)) for item in history]
+        total = sum(tokens)
+        if total <= self.max_tokens:
+            return history
+
+        user_turns = [i for i, item in enumerate(history) if _is_user_message(item)]
+        if len(user_turns) <= self.keep_recent_turns + 1:
+            return history
+        target = int(self.max_tokens * self.target_ratio)
+        protected_end = user_turns[0] + 1  # system prompt and task turn, the cached prefix
+        recent_start = user_turns[-self.keep_recent_turns]
+
+        # 1. cut long outputs of old tool calls
+        for i in range(protected_end, recent_start):
+            if total <= target:
+                break
+            item = history[i]
+            if _is_tool_output(item) and len(item["output"]) > self.max_tool_output_chars:
+                omitted = len(item["output"]) - self.max_tool_output_chars
+                item["output"] = item["output"][:self.max_tool_output_chars] + f"\n... [{omitted} characters of old tool output removed]"
+                new_tokens = _tokens(estimate_size(item))
+                total -= tokens[i] - new_tokens
+                tokens[i] = new_tokens
+                self._metrics["truncated_tool_outputs"] += 1
+
+        # 2. drop the oldest steps, up to a user turn so tool calls stay paired with their outputs
+        if total > target:
+            has_note = protected_end < len(history) and _is_omission_note(history[protected_end])
+            drop_from = protected_end + int(has_note)
+            cut, dropped = None, 0
+            for boundary in (i for i in user_turns if drop_from < i <= recent_start):
+                cut, dropped = boundary, sum(tokens[drop_from:boundary])
+                if total - dropped <= target:
+                    break
+            if cut is not None:
+                self.omitted_turns += sum(1 for i in user_turns if drop_from <= i < cut)
+                del history[drop_from:cut]
+                note = {"role": "developer", "content": _OMISSION_NOTE.format(count=self.omitted_turns)}
+                if has_note:
+                    history[protected_end] = note
+                else:
+                    history.insert(protected_end, note)
+                total -= dropped
+
+        self._metrics["compactions"] += 1
+        self._metrics["omitted_turns"] = self.omitted_turns
+        logger.info(f"Compacted planner history to ~{total} tokens ({len(history)} items, {self.omitted_turns} steps omitted)")
+        return history
+
+
+def _tokens(size: dict) -> int:
+    return size["history_bytes"] // _BYTES_PER_TOKEN + size["screenshots"] * _IMAGE_TOKENS
+
+
+def _is_user_message(item) -> bool:
+    return isinstance(item, dict) and item.get("role") == "user"
+
+
+def _is_tool_output(item) -> bool:
+    return isinstance(item, dict) and item.get("type") == "function_call_output" and isinstance(item.get("output"), str)
+
+
+def _is_omission_note(item) -> bool:
+    return isinstance(item, dict) and item.get("role") == "developer" and "earlier steps were removed" in str(item.get("content"))
@@ -12,13 +12,15 @@ from agents.hybrid.skill_agent.skill_tools import SkillsToolSet
 class SkillAgent(Custom2Agent):
     """Hybrid with coding tools + skill management"""
     def __init__(self, vm_http_server: str, name: str = "skill-agent"):
+        self.skill_manager = SkillCatalogManager()
         super().__init__(name=name, vm_http_server=vm_http_server)
         
-        self.skill_manager = SkillCatalogManager()
         self.skill_curator = SkillCurator(skill_catalog_manager=self.skill_manager)
 
         self.system_prompt = self.generate_system_prompt()
-        self.tool_set = SkillsToolSet(vm_http_server=vm_http_server, skill_catalog_manager=self.skill_manager)
+
+    def _build_tool_set(self) -> SkillsToolSet:
+        return SkillsToolSet(vm_http_server=self.vm_http_server, skill_catalog_manager=self.skill_manager)
 
     def generate_system_prompt(self) -> str:
         system_prompt = SKILL_AGENT_PROMPT.format(
@@ -1,13 +1,13 @@
 import json
 
-from agents.grounders.qwen3_vl import Qwen3VLGrounder
+from agents.grounders.grounder_factory import build_grounder
 from agents.hybrid.skill_agent.models.skill_catalog_manager import SkillCatalogManager
 from agents.hybrid.tools import CuaToolSet
 
 class SkillsToolSet(CuaToolSet):
     def __init__(self, vm_http_server: str, skill_catalog_manager: SkillCatalogManager):
         super().__init__(
-            grounder=Qwen3VLGrounder(),
+            grounder=build_grounder(),
             http_server=vm_http_server,
             enable_python_execution_tool=True,
             enable_terminal_command_tool=True,
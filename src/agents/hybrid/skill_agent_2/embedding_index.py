@@ -0,0 +1,136 @@
+import numpy as np
+
+
+class SkillEmbeddingIndex:
+    """
+    Similarity index over skill description embeddings.
+
+    Keeps one contiguous float32 matrix of L2-normalized rows per domain, so a similarity query
+    is a single matrix-vector product instead of a python loop over all skills of the domain.
+    Rows are updated in place on upsert and removed by moving the last row into the freed slot.
+
+    Embeddings added with `add_lazy` (e.g. rows of a memory-mapped store) are only read once their domain
+    is first used, so domains that are never queried are never paged in.
+    """
+
+    def __init__(self):
+        self._matrices: dict[str, np.ndarray] = {}  # domain -> (capacity, dim), rows [0, size) are valid
+        self._names: dict[str, list[str]] = {}  # domain -> skill names aligned with the matrix rows
+        self._rows: dict[str, dict[str, int]] = {}  # domain -> skill name -> row
+        self._pending: dict[str, dict[str, object]] = {}  # domain -> skill name -> embedding not read yet
+
+    def size(self, domain: str) -> int:
+        self._materialize(domain)
+        return len(self._names.get(domain, []))
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        domain, name = key
+        return name in self._rows.get(domain, {}) or name in self._pending.get(domain, {})
+
+    def add_lazy(self, domain: str, name: str, embedding) -> None:
+        """Add an embedding that is read only when the domain is first queried or modified."""
+        if domain in self._matrices:
+            self.upsert(domain, name, embedding)
+        else:
+            self._pending.setdefault(domain, {})[name] = embedding
+
+    def _materialize(self, domain: str) -> None:
+        pending = self._pending.pop(domain, None)
+        if pending:
+            for name, embedding in pending.items():
+                self.upsert(domain, name, embedding)
+
+    def upsert(self, domain: str, name: str, embedding) -> None:
+        self._materialize(domain)
+        vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows = self._rows.setdefault(domain, {})
+        names = self._names.setdefault(domain, [])
+
+        if name in rows:
+            self._matrices[domain][rows[name]] = vector
+            return
+
+        matrix = self._matrices.get(domain)
+        if matrix is None:
+            matrix = np.empty((4, vector.shape[0]), dtype=np.float32)
+        elif matrix.shape[1] != vector.shape[0]:
+            raise ValueError(f"Embedding of '{domain}/{name}' has dimension {vector.shape[0]}, expected {matrix.shape[1]}")
+        elif len(names) == matrix.shape[0]:
+            # grow geometrically, so appends are amortized O(dim)
+            grown = np.empty((matrix.shape[0] * 2, matrix.shape[1]), dtype=np.float32)
+            grown[:len(names)] = matrix[:len(names)]
+            matrix = grown
+
+        matrix[len(names)] = vector
+        rows[name] = len(names)
+        names.append(name)
+        self._matrices[domain] = matrix
+
+    def remove(self, domain: str, name: str) -> None:
+        self._materialize(domain)
+        rows = self._rows.get(domain, {})
+        if name not in rows:
+            return
+        names = self._names[domain]
+        matrix = self._matrices[domain]
+
+        row = rows.pop(name)
+        last_row = len(names) - 1
+        if row != last_row:
+            # move the last row into the freed slot
+            matrix[row] = matrix[last_row]
+            names[row] = names[last_row]
+            rows[names[row]] = row
+        names.pop()
+
+    def query(self, domain: str, embedding, k: int, threshold: float = None) -> list[tuple[str, float]]:
+        """Return up to k (skill name, cosine similarity) pairs of the domain, most similar first."""
+        size = self.size(domain)
+        if size == 0 or k <= 0:
+            return []
+
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        scores = self._matrices[domain][:size] @ query
+
+        if k < size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(scores[top])[::-1]]
+        if threshold is not None:
+            top = top[scores[top] >= threshold]
+
+        names = self._names[domain]
+        return [(names[i], float(scores[i])) for i in top]
+
+    def similar_pairs(self, domain: str, threshold: float, block_size: int = 1024) -> list[tuple[str, str, float]]:
+        """
+        Return all (skill name, skill name, cosine similarity) pairs of the domain at or above the threshold,
+        most similar first. The similarity matrix is computed in row blocks of `block_size`, so memory stays
+        at block_size x n floats for large domains.
+        """
+        size = self.size(domain)
+        if size < 2:
+            return []
+        matrix = self._matrices[domain][:size]
+        names = self._names[domain]
+
+        pairs = []
+        for start in range(0, size, block_size):
+            end = min(start + block_size, size)
+            # only columns >= start are needed, everything left of them was covered by earlier blocks
+            scores = matrix[start:end] @ matrix[start:].T
+            # strictly upper triangle: drop self-similarities and mirrored pairs
+            rows, cols = np.nonzero(np.triu(scores >= threshold, k=1))
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                pairs.append((names[start + row], names[start + col], float(scores[row, col])))
+
+        pairs.sort(key=lambda x: x[2], reverse=True)
+        return pairs
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector
+    return vector / norm
@@ -0,0 +1,151 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+_META_FILE = "embeddings.meta.json"
+_LEGACY_FILE = "embeddings.json"
+# float16 halves the store but rounds each component (relative error ~5e-4), so cosine similarities of reloaded
+# embeddings can differ from freshly created ones by ~1e-3, enough to flip pairs right at a similarity threshold.
+# float32 stores them exactly. Changing it rewrites the store on the next save.
+_DTYPE = np.dtype(os.getenv("SKILL_EMBEDDING_DTYPE", "float16"))
+_MIN_COMPACT_ROWS = 256  # don't bother compacting small matrices
+
+
+class EmbeddingStore:
+    """
+    Binary store for the skill embeddings of a skill book directory.
+
+    The vectors are rows of a raw float16 (see _DTYPE) matrix, which is memory-mapped on load, so only the pages that are
+    actually read are loaded. A small JSON sidecar maps each skill ID to its row and description hash.
+
+    The matrix is append-only: new or re-embedded skills get a new row, saving otherwise only rewrites the
+    sidecar. Rows no longer referenced are left behind until they outnumber the live rows, then the live rows
+    are copied into a new matrix file. The sidecar names the matrix file and is replaced atomically, so a crash
+    at any point leaves a consistent store.
+    """
+
+    def __init__(self, location: Path | str):
+        self.location = Path(location)
+        self.meta_path = self.location / _META_FILE
+        self.legacy_path = self.location / _LEGACY_FILE
+
+    def load(self) -> dict[str, tuple[np.ndarray, str]]:
+        """Return skill id -> (read-only embedding, description hash)."""
+        if not self.meta_path.exists() and self.legacy_path.exists():
+            self._migrate_legacy()
+
+        meta = self._read_meta()
+        matrix = self._open_matrix(meta)
+        return {
+            skill_id: (matrix[entry["row"]], entry["description_hash"])
+            for skill_id, entry in meta["skills"].items()
+        }
+
+    def save(self, embeddings: dict[str, tuple[np.ndarray, str]]):
+        """Persist skill id -> (embedding, description hash), appending only embeddings that are not stored yet."""
+        os.makedirs(self.location, exist_ok=True)
+        meta = self._read_meta()
+        dim = meta["dim"]
+        if embeddings:
+            dim = len(next(iter(embeddings.values()))[0])
+        stale_file = None
+        if meta["dim"] is not None and (meta["dim"] != dim or _dtype(meta) != _DTYPE):
+            logger.info(f"Embedding format changed from {meta['dim']} x {_dtype(meta)} to {dim} x {_DTYPE}, rewriting embedding store")
+            stale_file = self.location / meta["file"]
+            meta = _empty_meta(generation=meta["generation"] + 1)
+
+        rows = {}
+        appended = []
+        for skill_id, (embedding, description_hash) in embeddings.items():
+            entry = meta["skills"].get(skill_id)
+            if entry is not None and entry["description_hash"] == description_hash:
+                rows[skill_id] = entry
+            else:
+                rows[skill_id] = {"row": meta["count"] + len(appended), "description_hash": description_hash}
+                appended.append(embedding)
+
+        count = meta["count"]
+        if appended:
+            vectors_path = self.location / meta["file"]
+            with open(vectors_path, "ab") as f:
+                # drop rows appended by an interrupted save, they are not referenced by the sidecar
+                f.truncate(count * dim * _DTYPE.itemsize)
+                f.write(np.asarray(appended, dtype=_DTYPE).tobytes())
+            count += len(appended)
+
+        new_meta = {**meta, "dim": dim, "count": count, "skills": rows}
+        if count > _MIN_COMPACT_ROWS and count > 2 * len(rows):
+            self._compact(new_meta)
+        else:
+            self._write_meta(new_meta)
+        if stale_file is not None:
+            stale_file.unlink(missing_ok=True)
+
+    def _migrate_legacy(self):
+        with open(self.legacy_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        self.save({
+            skill_id: (np.asarray(cached["embedding"], dtype=np.float32), cached.get("description_hash"))
+            for skill_id, cached in legacy.items()
+            if cached.get("embedding") is not None
+        })
+        self.legacy_path.unlink()
+        logger.info(f"Migrated {len(legacy)} embeddings from {self.legacy_path} to the binary embedding store")
+
+    def _compact(self, meta: dict):
+        old_file = self.location / meta["file"]
+        matrix = self._open_matrix(meta)
+        skill_ids = list(meta["skills"].keys())
+
+        compacted = _empty_meta(generation=meta["generation"] + 1)
+        with open(self.location / compacted["file"], "wb") as f:
+            f.write(np.ascontiguousarray(matrix[[meta["skills"][skill_id]["row"] for skill_id in skill_ids]]).tobytes())
+        compacted.update({
+            "dim": meta["dim"],
+            "count": len(skill_ids),
+            "skills": {
+                skill_id: {"row": row, "description_hash": meta["skills"][skill_id]["description_hash"]}
+                for row, skill_id in enumerate(skill_ids)
+            },
+        })
+        self._write_meta(compacted)
+        logger.info(f"Compacted embedding store from {meta['count']} to {len(skill_ids)} rows")
+
+        # skill books loaded earlier keep their mapping of the old file alive until they are dropped
+        del matrix
+        old_file.unlink(missing_ok=True)
+
+    def _open_matrix(self, meta: dict) -> np.ndarray:
+        if meta["count"] == 0:
+            return np.empty((0, meta["dim"] or 0), dtype=_dtype(meta))
+        return np.memmap(self.location / meta["file"], dtype=_dtype(meta), mode="r", shape=(meta["count"], meta["dim"]))
+
+    def _read_meta(self) -> dict:
+        if not self.meta_path.exists():
+            return _empty_meta()
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: dict):
+        tmp_path = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+
+def _dtype(meta: dict) -> np.dtype:
+    return np.dtype(meta.get("dtype", "float16"))
+
+
+def _empty_meta(generation: int = 0) -> dict:
+    return {
+        "generation": generation,
+        "file": f"embeddings.{generation}.f{_DTYPE.itemsize * 8}",
+        "dtype": _DTYPE.name,
+        "dim": None,
+        "count": 0,
+        "skills": {},
+    }
@@ -3,14 +3,15 @@ import os
 from datetime import datetime
 from loguru import logger
 from tenacity import retry, stop_after_attempt, wait_exponential
-from agents.grounders.qwen3_vl import Qwen3VLGrounder
+from agents.grounders.grounder_factory import build_grounder
 from agents.hybrid.agent import Custom3Agent
 from agents.hybrid.skill_agent_2.skill_agent_prompt import build_skill_agent_prompt
-from agents.hybrid.skill_agent_2.skill_book import SkillBook, SkillFetchError
-from agents.hybrid.skill_agent_2.reflector import SkillsReflector
+from agents.hybrid.skill_agent_2.skill_book import SkillBook, SkillFetchError, get_skill_book_store
+from agents.hybrid.skill_agent_2.reflector import SkillsReflector, TrajectoryReflection
 from agents.hybrid.skill_agent_2.skill_manager import SkillManager
 
 from agents.hybrid.tools import CuaToolSet
+from domain.request import TokenUsage
 
 class SkillTools(CuaToolSet):
     def __init__(self, vm_http_server: str, skill_book: SkillBook):
@@ -18,7 +19,7 @@ class SkillTools(CuaToolSet):
             enable_python_execution_tool=True, 
             enable_terminal_command_tool=True, 
             http_server=vm_http_server,
-            grounder=Qwen3VLGrounder()
+            grounder=build_grounder()
         )
         self.skill_book = skill_book
         self.tools = self.tools + [
@@ -98,14 +99,17 @@ class SkillTools(CuaToolSet):
 class SkillAgent2(Custom3Agent):
     """Hybrid with coding tools + skill management"""
     def __init__(self, vm_http_server: str, name: str = "skill-agent-2", disable_learning: bool = False, model = None):
+        # read-only snapshot shared with other sessions, learning goes through the store's transactions
+        self.skill_book_store = get_skill_book_store()
+        self.skill_book = self.skill_book_store.snapshot()
         super().__init__(name=name, vm_http_server=vm_http_server, model=model)
-        self.skill_book = SkillBook.load()
-        self.skill_manager = SkillManager(skill_book=self.skill_book)
         self.reflector = SkillsReflector(skill_book=self.skill_book)
-        self.tool_set = SkillTools(vm_http_server=vm_http_server, skill_book=self.skill_book)
         self.system_prompt = build_skill_agent_prompt(self.skill_book.get_domain_ids())
         self.disable_learning = disable_learning
 
+    def _build_tool_set(self) -> SkillTools:
+        return SkillTools(vm_http_server=self.vm_http_server, skill_book=self.skill_book)
+
     @retry(
        reraise=True,
        stop=stop_after_attempt(4),
@@ -133,10 +137,10 @@ class SkillAgent2(Custom3Agent):
         self.last_response_id = response.id
         return response
     
-    def _learn(self) -> dict:
-        reflection, token_usage = self.reflector.reflect(self.last_response_id, self.tool_set.get_requested_skill_ids())
-        skill_manager_history = self.skill_manager.learn(reviews=reflection.skill_reviews, learnings=reflection.new_learnings)
-        cleanup_log = self.skill_manager.cleanup()
+    def _learn(self, skill_book: SkillBook, reflection: TrajectoryReflection, token_usage: TokenUsage) -> dict:
+        skill_manager = SkillManager(skill_book=skill_book)
+        skill_manager_history = skill_manager.learn(reviews=reflection.skill_reviews, learnings=reflection.new_learnings)
+        cleanup_log = skill_manager.cleanup()
         learning_log = {
             "reflection": {
                 "reflections": reflection.model_dump(),
@@ -154,13 +158,13 @@ class SkillAgent2(Custom3Agent):
         self._remove_screenshots_from_history(remove_all=True)
         self._make_checkpoint()
 
-        learning_log = self._learn()
-        learning_log["task_id"] = task_id
+        # reflection only reads the skills seen during the task, so it runs outside of the (serialized) transaction
+        reflection, token_usage = self.reflector.reflect(self.last_response_id, self.tool_set.get_requested_skill_ids())
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-        self.skill_book.save()
-        self.skill_book.save(location=f".skill-backups/{timestamp}", omit_embeddings=True)
+        with self.skill_book_store.transaction(backup_location=f".skill-backups/{timestamp}") as skill_book:
+            learning_log = self._learn(skill_book, reflection, token_usage)
+            learning_log["task_id"] = task_id
 
         # persist learning log
         log_dir = ".learning_logs"
@@ -1,12 +1,18 @@
 import hashlib
-import json
 import os
+import shutil
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from pydantic import BaseModel, Field
+from typing import Iterator
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 import frontmatter
 from loguru import logger
 
-from utils import create_embeddings
+from utils import create_embeddings, create_embeddings_batched
+from agents.hybrid.skill_agent_2.embedding_index import SkillEmbeddingIndex
+from agents.hybrid.skill_agent_2.embedding_store import EmbeddingStore
 
 
 _SKILL_DIR = Path(__file__).parent / ".skills"
@@ -17,6 +23,18 @@ def _hash_description(description: str) -> str:
     """Create a hash of the description for change detection."""
     return hashlib.sha256(description.encode()).hexdigest()[:16]
 
+
+def _atomic_write(path: Path, content: str):
+    """
+    Write to a temp file and rename it over the target, so readers never see a partial file.
+    Since files are replaced instead of modified in place, hard links to the previous version
+    (see `SkillBook.backup`) keep their content.
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
 class SkillError(Exception):
     pass
 
@@ -41,14 +59,19 @@ class SkillMetrics(BaseModel):
     neutral_impact: int = 0
 
 class Skill(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     domain: str
     name: str
     description: str
     body: str
     annotations: list[str] = Field(default_factory=list)
     metrics: SkillMetrics = Field(default_factory=SkillMetrics)
-    embedding: list[float] | None = Field(default=None, exclude=True)
+    embedding: np.ndarray | None = Field(default=None, exclude=True)
     description_hash: str | None = Field(default=None, exclude=True)
+
+    # Fingerprint of the content last written to (or read from) the skill book location, None if never saved
+    _saved_fingerprint: str | None = PrivateAttr(default=None)
     
     @property
     def title(self) -> str:
@@ -71,8 +94,18 @@ class Skill(BaseModel):
         post = frontmatter.Post(self.body, **metadata)
         
         skill_path = domain_dir / f"{self.name}.md"
-        with open(skill_path, "w", encoding="utf-8") as f:
-            f.write(frontmatter.dumps(post))
+        _atomic_write(skill_path, frontmatter.dumps(post))
+
+    def _fingerprint(self) -> str:
+        return hashlib.sha256(self.model_dump_json().encode()).hexdigest()
+
+    @property
+    def is_dirty(self) -> bool:
+        """Whether the skill changed since it was last saved to (or loaded from) the skill book location."""
+        return self._saved_fingerprint != self._fingerprint()
+
+    def mark_saved(self):
+        self._saved_fingerprint = self._fingerprint()
     
     def needs_embedding_update(self) -> bool:
         """Check if the embedding needs to be updated."""
@@ -80,9 +113,9 @@ class Skill(BaseModel):
             return True
         return self.description_hash != _hash_description(self.description)
     
-    def set_embedding(self, embedding: list[float]):
+    def set_embedding(self, embedding: list[float] | np.ndarray):
         """Set the embedding and update the description hash."""
-        self.embedding = embedding
+        self.embedding = np.asarray(embedding, dtype=np.float32)
         self.description_hash = _hash_description(self.description)
     
     def to_evaluation_markdown(self) -> str:
@@ -127,6 +160,17 @@ class SkillDomain(BaseModel):
     id: str
     skills: dict[str, Skill] = Field(default_factory=dict)
 
+    # Names of the skills whose files exist in the skill book location
+    _saved_skill_names: set[str] = PrivateAttr(default_factory=set)
+
+    @property
+    def removed_skill_names(self) -> set[str]:
+        """Skills that were saved, but have been removed since."""
+        return self._saved_skill_names - self.skills.keys()
+
+    def mark_saved(self):
+        self._saved_skill_names = set(self.skills.keys())
+
     def add_skill(self, skill: Skill):
         self.skills[skill.name] = skill
 
@@ -156,17 +200,18 @@ class SkillDomain(BaseModel):
 class SkillBook(BaseModel):
     domains: dict[str, SkillDomain] = Field(default_factory=dict)
 
+    # Vectorized similarity index, kept in sync with the skills' embeddings
+    _index: SkillEmbeddingIndex = PrivateAttr(default_factory=SkillEmbeddingIndex)
+    # Directory the skill book was loaded from, saves to it only write changes
+    _location: Path = PrivateAttr(default=_SKILL_DIR)
+
     @classmethod
     def load(cls, location: Path | str = None) -> "SkillBook":
         location = Path(location) if location else _SKILL_DIR
         domains: dict[str, SkillDomain] = {}
-        embeddings_cache: dict[str, dict] = {}
 
-        # Load existing embeddings cache
-        embeddings_path = location / "embeddings.json"
-        if embeddings_path.exists():
-            with open(embeddings_path, "r", encoding="utf-8") as f:
-                embeddings_cache = json.load(f)
+        # Memory-mapped embeddings, rows are only read once they are accessed
+        embeddings_cache = EmbeddingStore(location).load()
 
         # Load skills into their domains
         for domain_dir in location.iterdir():
@@ -188,22 +233,39 @@ class SkillBook(BaseModel):
                     
                     # Restore embedding from cache if available
                     if skill.id in embeddings_cache:
-                        cached = embeddings_cache[skill.id]
-                        skill.embedding = cached.get("embedding")
-                        skill.description_hash = cached.get("description_hash")
+                        skill.embedding, skill.description_hash = embeddings_cache[skill.id]
                     
+                    skill.mark_saved()
                     domains[domain_id].add_skill(skill)
 
+        for domain in domains.values():
+            domain.mark_saved()
+
         skill_book = cls(domains=domains)
+        skill_book._location = location
+        for skill in skill_book.get_all_skills():
+            if skill.embedding is not None:
+                # the memory-mapped rows are read once the domain is first searched
+                skill_book._index.add_lazy(skill.domain, skill.name, skill.embedding)
         
         # Generate embeddings for skills that need them
         skill_book._ensure_embeddings(location)
         
         return skill_book
+
+    def _sync_index(self, skill: Skill):
+        """Mirror the skill's current embedding in the similarity index."""
+        if skill.embedding is None:
+            self._index.remove(skill.domain, skill.name)
+        else:
+            self._index.upsert(skill.domain, skill.name, skill.embedding)
     
-    def _ensure_embeddings(self, location: Path = None):
-        """Generate embeddings for skills that don't have them or have changed descriptions."""
-        location = location or _SKILL_DIR
+    def _ensure_embeddings(self, location: Path = None, persist: bool = True):
+        """
+        Generate embeddings for skills that don't have them or have changed descriptions.
+        With persist=False the embeddings are only written by the next `save`.
+        """
+        location = location or self._location
         all_skills = self.get_all_skills()
         
         skills_needing_embeddings = [
@@ -219,48 +281,100 @@ class SkillBook(BaseModel):
         
         logger.info(f"Generating embeddings for {len(skills_needing_embeddings)} skills...")
         
-        descriptions = [skill.description for skill in skills_needing_embeddings]
-        new_embeddings = create_embeddings(descriptions)
-        
-        for skill, embedding in zip(skills_needing_embeddings, new_embeddings):
-            skill.set_embedding(embedding)
-            logger.debug(f"Created embedding for skill: {skill.id}")
+        def on_batch(indices: list[int], embeddings: list[np.ndarray]):
+            for i, embedding in zip(indices, embeddings):
+                skill = skills_needing_embeddings[i]
+                skill.set_embedding(embedding)
+                self._sync_index(skill)
+                logger.debug(f"Created embedding for skill: {skill.id}")
+            # Persist progress, so an interrupted load resumes without re-embedding these skills
+            if persist:
+                self._save_embeddings(location)
         
-        # Save updated embeddings
-        self._save_embeddings(location)
+        descriptions = [skill.description for skill in skills_needing_embeddings]
+        try:
+            create_embeddings_batched(descriptions, on_batch=on_batch)
+        except Exception as e:
+            # Skills without an embedding are left out of similarity search until the next load
+            logger.error(f"Failed to generate embeddings for some skills, continuing without them: {e}")
 
     def _save_embeddings(self, location: Path = None):
-        """Save embeddings to file."""
-        location = location or _SKILL_DIR
-        embeddings_path = location / "embeddings.json"
+        """Save embeddings to the binary embedding store, only new or changed embeddings are written."""
+        location = Path(location) if location else self._location
         
-        embeddings_data = {}
-        for skill in self.get_all_skills():
-            if skill.embedding is not None:
-                embeddings_data[skill.id] = {
-                    "description_hash": skill.description_hash,
-                    "embedding": skill.embedding
-                }
+        embeddings_data = {
+            skill.id: (skill.embedding, skill.description_hash)
+            for skill in self.get_all_skills()
+            if skill.embedding is not None
+        }
         
-        with open(embeddings_path, "w", encoding="utf-8") as f:
-            json.dump(embeddings_data, f, indent=4, ensure_ascii=False)
-        logger.info(f"Saved embeddings to {embeddings_path}")
+        EmbeddingStore(location).save(embeddings_data)
+        logger.info(f"Saved embeddings to {location}")
 
     def save(self, location: Path | str = None, omit_embeddings: bool = False):
-        location = Path(location) if location else _SKILL_DIR
+        """
+        Save the skill book. Saving to the location it was loaded from only writes changed skills and
+        deletes the files of removed ones, saving to any other location writes every skill.
+        """
+        location = Path(location) if location else self._location
+        incremental = location.resolve() == self._location.resolve()
         os.makedirs(location, exist_ok=True)
 
         # Save each skill file
+        written = 0
         for domain_id, domain in self.domains.items():
             domain_dir = location / domain_id
             os.makedirs(domain_dir, exist_ok=True)
 
             for skill_name, skill in domain.skills.items():
+                if incremental and not skill.is_dirty:
+                    continue
                 skill.save(domain_dir)
+                written += 1
+                if incremental:
+                    skill.mark_saved()
+
+            if incremental:
+                for skill_name in domain.removed_skill_names:
+                    skill_path = domain_dir / f"{skill_name}.md"
+                    if skill_path.exists():
+                        skill_path.unlink()
+                        logger.info(f"Deleted skill file: {skill_path}")
+                domain.mark_saved()
+
+        logger.info(f"Saved {written} skill files to {location}")
 
         if not omit_embeddings:
             self._save_embeddings(location)
 
+    def backup(self, location: Path | str):
+        """
+        Save an incremental copy of the skill book (without embeddings). Skills unchanged since the last save
+        are hard links to the files in the skill book location, so a backup only takes space for changed skills.
+        """
+        location = Path(location)
+        os.makedirs(location, exist_ok=True)
+
+        linked = 0
+        for domain_id, domain in self.domains.items():
+            domain_dir = location / domain_id
+            os.makedirs(domain_dir, exist_ok=True)
+
+            for skill_name, skill in domain.skills.items():
+                source = self._location / domain_id / f"{skill_name}.md"
+                if skill.is_dirty or not source.exists():
+                    skill.save(domain_dir)
+                    continue
+                target = domain_dir / f"{skill_name}.md"
+                try:
+                    os.link(source, target)
+                except OSError:
+                    # e.g. a different file system
+                    shutil.copy2(source, target)
+                linked += 1
+
+        logger.info(f"Backed up skill book to {location} ({linked}/{len(self.get_all_skill_ids())} skills unchanged)")
+
     def list_domains(self) -> str:
         if not self.domains:
             return "No domains available."
@@ -317,26 +431,19 @@ class SkillBook(BaseModel):
         )
 
         domain.add_skill(skill)
+        # embeds the new skill, so it is found by similarity search right away
+        self._ensure_embeddings(persist=False)
         return skill
     
-    def remove_skill(self, skill_id: str, location: Path | str = None):
+    def remove_skill(self, skill_id: str):
+        """Remove the skill, its file and embedding are deleted on the next `save`."""
         domain_id, skill_name = skill_id.split("/", 1)
         domain = self.get_domain(domain_id)
         if skill_name not in domain.skills:
             raise SkillFetchError(f"Skill '{skill_id}' not found.")
         
-        # Delete the skill file from disk
-        location = Path(location) if location else _SKILL_DIR
-        skill_path = location / domain_id / f"{skill_name}.md"
-        if skill_path.exists():
-            skill_path.unlink()
-            logger.info(f"Deleted skill file: {skill_path}")
-        
-        # Remove from in-memory dictionary
         del domain.skills[skill_name]
-        
-        # Update embeddings cache to remove the deleted skill
-        self._save_embeddings(location)
+        self._index.remove(domain_id, skill_name)
 
     def update_skill(
         self,
@@ -362,6 +469,9 @@ class SkillBook(BaseModel):
             skill.annotations = []
             changes.append("Annotations cleared")
         
+        if skill.needs_embedding_update():
+            self._ensure_embeddings(persist=False)
+        self._sync_index(skill)
         return skill, changes
 
     def list_skills(self, domain: str = None) -> str:
@@ -381,15 +491,6 @@ class SkillBook(BaseModel):
             skill_ids.extend(domain.get_skill_ids())
         return skill_ids
 
-    def _cosine_similarity(self, vec1: list[float], vec2: list[float]) -> float:
-        """Calculate cosine similarity between two vectors."""
-        dot_product = sum(a * b for a, b in zip(vec1, vec2))
-        magnitude1 = sum(a * a for a in vec1) ** 0.5
-        magnitude2 = sum(b * b for b in vec2) ** 0.5
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0
-        return dot_product / (magnitude1 * magnitude2)
-
     def find_similar_skills(
         self, 
         description: str, 
@@ -411,37 +512,27 @@ class SkillBook(BaseModel):
             or a message if no similar skills are found.
         """
         domain_obj = self.get_domain(domain)
-        skills = list(domain_obj.skills.values())
         
-        if not skills:
+        if not domain_obj.skills:
             return f"No skills found in domain '{domain}'."
         
-        # Filter skills that have embeddings
-        skills_with_embeddings = [s for s in skills if s.embedding is not None]
-        if not skills_with_embeddings:
+        if self._index.size(domain) == 0:
             return f"No skills with embeddings found in domain '{domain}'."
         
         # Create embedding for the description
         logger.info(f"Creating embedding for similarity search in domain '{domain}'")
         query_embedding = create_embeddings(description)[0]
         
-        # Find similar skills
-        similar_skills: list[tuple[Skill, float]] = []
-        for skill in skills_with_embeddings:
-            similarity = self._cosine_similarity(query_embedding, skill.embedding)
-            if similarity >= threshold:
-                similar_skills.append((skill, similarity))
+        # Top max_skills above the threshold, highest similarity first
+        similar_skills = self._index.query(domain, query_embedding, k=max_skills, threshold=threshold)
         
         if not similar_skills:
             return f"No similar skills found in domain '{domain}'."
         
-        # Sort by similarity (highest first) and take top max_skills
-        similar_skills.sort(key=lambda x: x[1], reverse=True)
-        similar_skills = similar_skills[:max_skills]
-        
         # Format as markdown separated by ---
         markdown_parts = []
-        for skill, similarity in similar_skills:
+        for skill_name, similarity in similar_skills:
+            skill = domain_obj.skills[skill_name]
             markdown_parts.append(
                 f"{skill.to_evaluation_markdown()}\n\n*Similarity: {similarity:.2%}*"
             )
@@ -464,25 +555,12 @@ class SkillBook(BaseModel):
             List of tuples (skill1, skill2, similarity) sorted by similarity descending.
         """
         domain_obj = self.get_domain(domain)
-        skills = list(domain_obj.skills.values())
-        
-        # Filter skills that have embeddings
-        skills_with_embeddings = [s for s in skills if s.embedding is not None]
-        if len(skills_with_embeddings) < 2:
-            return []
-        
-        # Find similar pairs
-        similar_pairs: list[tuple[Skill, Skill, float]] = []
-        for i, skill1 in enumerate(skills_with_embeddings):
-            for skill2 in skills_with_embeddings[i + 1:]:
-                similarity = self._cosine_similarity(skill1.embedding, skill2.embedding)
-                if similarity >= threshold:
-                    similar_pairs.append((skill1, skill2, similarity))
         
-        # Sort by similarity (highest first)
-        similar_pairs.sort(key=lambda x: x[2], reverse=True)
-        
-        return similar_pairs
+        # Blocked matrix product over the domain's embeddings, already sorted by similarity (highest first)
+        return [
+            (domain_obj.skills[name1], domain_obj.skills[name2], similarity)
+            for name1, name2, similarity in self._index.similar_pairs(domain, threshold)
+        ]
     
     def get_all_skills(self) -> list[Skill]:
         skills = []
@@ -491,6 +569,71 @@ class SkillBook(BaseModel):
         return skills
 
 
+class SkillBookStore:
+    """
+    Process-wide owner of the skill book.
+
+    `snapshot()` returns the currently published version. It is shared by all sessions and must be treated as
+    read-only. Learning edits a private copy inside `transaction()`, which is published atomically (by swapping
+    the reference) once the transaction completes, and only then saved to disk. Transactions are serialized,
+    sessions holding an older snapshot keep reading it until they are re-initialized.
+    """
+
+    def __init__(self, location: Path | str = None):
+        self.location = Path(location) if location else _SKILL_DIR
+        self._current: SkillBook | None = None
+        self._version = 0
+        self._load_lock = threading.Lock()
+        self._transaction_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self) -> SkillBook:
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._publish(SkillBook.load(self.location))
+                current = self._current
+        return current
+
+    @contextmanager
+    def transaction(self, backup_location: Path | str = None) -> Iterator[SkillBook]:
+        """
+        Yield a mutable copy of the latest skill book. If the block completes without error, the copy is published,
+        saved and, with a backup_location, backed up. Nothing is written to disk if the block fails.
+        """
+        with self._transaction_lock:
+            working_copy = self.snapshot().model_copy(deep=True)
+            yield working_copy
+            working_copy._ensure_embeddings(persist=False)
+            self._publish(working_copy)
+            working_copy.save()
+            if backup_location is not None:
+                working_copy.backup(location=backup_location)
+
+    def reload(self) -> SkillBook:
+        """Re-read the skill book from disk and publish it."""
+        with self._transaction_lock:
+            skill_book = SkillBook.load(self.location)
+            self._publish(skill_book)
+            return skill_book
+
+    def _publish(self, skill_book: SkillBook):
+        self._current = skill_book
+        self._version += 1
+        logger.info(f"Published skill book version {self._version} ({len(skill_book.get_all_skill_ids())} skills)")
+
+
+_skill_book_store = SkillBookStore()
+
+
+def get_skill_book_store() -> SkillBookStore:
+    return _skill_book_store
+
+
 if __name__ == "__main__":
     # Example usage
     skill_book = SkillBook.load()
@@ -1,8 +1,9 @@
 import json
+from loguru import logger
 from pydantic import BaseModel
 from tenacity import retry, stop_after_attempt, wait_exponential
 from agents.hybrid.skill_agent_2.reflector import Learning, SkillNegative, SkillNeutral, SkillNotFollowed, SkillPositive, SkillReview
-from agents.hybrid.skill_agent_2.skill_book import Skill, SkillBook
+from agents.hybrid.skill_agent_2.skill_book import Skill, SkillBook, SkillError
 from agents.hybrid.skill_agent_2.skill_manager_tools import SkillManagerTools
 from domain.request import TokenUsage
 from utils import get_openai_client, get_tool_calls_from_response
@@ -267,7 +268,12 @@ class SkillManager:
         return learning_history
     
     def manage_skill_review(self, review: SkillReview):
-        skill = self.skill_book.get_skill(review.skill_id)
+        try:
+            skill = self.skill_book.get_skill(review.skill_id)
+        except SkillError:
+            # the skill (or its domain) may have been merged or deleted by a learning run that finished in the meantime
+            logger.warning(f"Skipping review of skill '{review.skill_id}', it no longer exists in the skill book.")
+            return None
         skill.metrics.times_requested += 1
 
         if isinstance(review, SkillPositive):
@@ -238,7 +238,6 @@ class SkillManagerTools:
         elif name == "create_domain":
             domain_id = args["domain"]
             self.skill_book.add_domain(domain_id)
-            self.skill_book.save()
             tool_result = f"Domain '{domain_id}' created successfully."
         
         elif name == "create_skill":
@@ -261,7 +260,6 @@ class SkillManagerTools:
                 body=args.get("body"),
                 dismiss_annotations=args.get("dismiss_annotations", True)
             )
-            self.skill_book.save()
             changes_str = "; ".join(changes) if changes else "No changes made"
             tool_result = f"Skill '{skill_id}' updated. {changes_str}.\n\n{skill.to_markdown()}"
         
@@ -295,7 +293,6 @@ class SkillManagerTools:
                 dismiss_annotations=args.get("dismiss_annotations", True)
             )
             self.skill_book.remove_skill(source_skill_id)
-            self.skill_book.save()
             tool_result = f"Skills '{source_skill_id}' merged into '{target_skill_id}'.\n\n{target_skill.to_markdown()}"
             
         else:
@@ -1,12 +1,16 @@
+import asyncio
 import json
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Sequence, Tuple
+from uuid import uuid4
 
 from loguru import logger
-import requests
 from tenacity import retry, stop_after_attempt, wait_exponential, wait_exponential
 
 from agents.grounders.grounder import Grounder, GroundingError
+from screenshot import Screenshot
+from vm_client import get_vm_client
 
 
 _computer_use_tools = [
@@ -200,6 +204,14 @@ _terminal_tool =  {
     }
 }
 
+# tools that need the grounder to resolve element descriptions into coordinates
+_GROUNDING_TOOLS = ("mouse_click", "move_cursor_to_element", "left_click_drag")
+_GROUNDING_ARGS = ("element", "start_element", "target_element")
+# upper bound of concurrent grounding calls for the elements of one planner response
+_MAX_GROUNDING_WORKERS = 8
+# tools that block on the VM http server
+_VM_TOOLS = ("execute_python_code", "execute_terminal_command")
+
 def _normalize_key(key: str) -> str:
     k = key.strip().lower()
     conversion = {
@@ -233,9 +245,11 @@ class CuaToolSet:
         ):
         self.tools = _computer_use_tools
         self.http_server = http_server
+        self.kernel_id = str(uuid4())  # python interpreter of this tool set on the VM, in kernel mode
         self.enable_python_execution_tool = enable_python_execution_tool
         self.enable_terminal_command_tool = enable_terminal_command_tool
         self.grounder = grounder
+        self._pregrounded = {}
 
         if self.enable_python_execution_tool or self.enable_terminal_command_tool:
             if not self.http_server:
@@ -246,7 +260,98 @@ class CuaToolSet:
         if self.enable_terminal_command_tool:
             self.tools.append(_terminal_tool)
 
-    def parse_action(self, tool_call: dict, screenshot: str) -> Tuple[str, str, tuple[int, int], bool]:
+    def close(self):
+        """Stop the python kernel of this tool set on the VM, if it has one."""
+        if self.http_server:
+            get_vm_client(self.http_server).stop_kernel(self.kernel_id)
+
+    def get_grounding_targets(self, tool_call) -> list[str]:
+        """Element descriptions of a tool call that need to be grounded before it can be parsed."""
+        if tool_call.name not in _GROUNDING_TOOLS:
+            return []
+        args = json.loads(tool_call.arguments)
+        return [args[key] for key in _GROUNDING_ARGS if isinstance(args.get(key), str)]
+
+    def _locate(self, element: str, screenshot: Screenshot) -> tuple[tuple[int, int], tuple[int, int]]:
+        """Locate an element on the screenshot, preferring coordinates already grounded by preground / apreground."""
+        pregrounded = self._pregrounded.get(element)
+        if pregrounded is None:
+            return self.grounder.locate_ui_element_coords(ui_element=element, screenshot=screenshot)
+        if isinstance(pregrounded, GroundingError):
+            raise pregrounded
+        return pregrounded
+
+    def _collect_grounding_targets(self, tool_calls: list) -> list[str]:
+        if self.grounder is None:
+            return []
+        elements = [element for tool_call in tool_calls for element in self.get_grounding_targets(tool_call)]
+        return list(dict.fromkeys(elements))
+
+    def preground(self, tool_calls: list, screenshot: Screenshot):
+        """Ground the elements of all tool calls concurrently on a thread pool, parse_action then reuses the results."""
+        elements = self._collect_grounding_targets(tool_calls)
+        if len(elements) < 2:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(elements), _MAX_GROUNDING_WORKERS)) as executor:
+            futures = {
+                element: executor.submit(self.grounder.locate_ui_element_coords, ui_element=element, screenshot=screenshot)
+                for element in elements
+            }
+        for element, future in futures.items():
+            try:
+                self._pregrounded[element] = future.result()
+            except GroundingError as e:
+                self._pregrounded[element] = e
+
+    async def apreground(self, tool_calls: list, screenshot: Screenshot):
+        """Ground the elements of all tool calls concurrently on the event loop, parse_action then reuses the results."""
+        elements = self._collect_grounding_targets(tool_calls)
+        results = await asyncio.gather(
+            *[self.grounder.alocate_ui_element_coords(ui_element=element, screenshot=screenshot) for element in elements],
+            return_exceptions=True,
+        )
+        for element, result in zip(elements, results):
+            if isinstance(result, BaseException) and not isinstance(result, GroundingError):
+                raise result
+            self._pregrounded[element] = result
+
+    def parse_actions(self, tool_calls: list, screenshot: str | Screenshot) -> list[Tuple[str, str, tuple[int, int], bool]]:
+        """
+        Parse all tool calls of one planner response. Their elements are grounded concurrently up front,
+        the actions are parsed in the original order.
+        """
+        screenshot = Screenshot.of(screenshot)
+        try:
+            self.preground(tool_calls, screenshot)
+            return [self.parse_action(tool_call, screenshot) for tool_call in tool_calls]
+        finally:
+            self._pregrounded.clear()
+
+    async def aparse_actions(self, tool_calls: list, screenshot: str | Screenshot) -> list[Tuple[str, str, tuple[int, int], bool]]:
+        """Async variant of parse_actions."""
+        screenshot = Screenshot.of(screenshot)
+        try:
+            await self.apreground(tool_calls, screenshot)
+            parsed_actions = []
+            for tool_call in tool_calls:
+                if tool_call.name in _VM_TOOLS:
+                    parsed_actions.append(await asyncio.to_thread(self.parse_action, tool_call, screenshot))
+                else:
+                    parsed_actions.append(self.parse_action(tool_call, screenshot))
+            return parsed_actions
+        finally:
+            self._pregrounded.clear()
+
+    async def aparse_action(self, tool_call, screenshot: str | Screenshot) -> Tuple[str, str, tuple[int, int], bool]:
+        """
+        Async variant of parse_action. Grounding calls are awaited on the event loop,
+        VM calls (python/terminal) are moved to a worker thread as they block on the http server.
+        """
+        return (await self.aparse_actions([tool_call], screenshot))[0]
+
+    def parse_action(self, tool_call: dict, screenshot: str | Screenshot) -> Tuple[str, str, tuple[int, int], bool]:
+        # decoded (and resized) at most once, however many elements are grounded on it
+        screenshot = Screenshot.of(screenshot)
         name = tool_call.name
         args = json.loads(tool_call.arguments)
 
@@ -280,7 +385,7 @@ class CuaToolSet:
             }.get(click_type, 1)
 
             try:
-                coords, usage = self.grounder.locate_ui_element_coords(ui_element=element, screenshot=screenshot)
+                coords, usage = self._locate(element, screenshot)
             except GroundingError as e:
                 tool_result = str(e)
                 return tool_result, "", usage, False
@@ -291,7 +396,7 @@ class CuaToolSet:
                 raise ValueError(f"move_cursor_to_element requires 'element' argument. Got arguments {args}")
             
             try:
-                coords, usage = self.grounder.locate_ui_element_coords(ui_element=element, screenshot=screenshot)
+                coords, usage = self._locate(element, screenshot)
             except GroundingError as e:
                 tool_result = str(e)
                 return tool_result, "", usage, False
@@ -303,8 +408,8 @@ class CuaToolSet:
                 raise ValueError(f"left_click_drag requires 'start_element' and 'target_element' arguments. Got arguments {args}")
             
             try:
-                start_coords, usage_start = self.grounder.locate_ui_element_coords(ui_element=start_element, screenshot=screenshot)
-                target_coords, usage_target = self.grounder.locate_ui_element_coords(ui_element=target_element, screenshot=screenshot)
+                start_coords, usage_start = self._locate(start_element, screenshot)
+                target_coords, usage_target = self._locate(target_element, screenshot)
             except GroundingError as e:
                 tool_result = str(e)
                 return tool_result, "", usage, False
@@ -421,15 +526,8 @@ class CuaToolSet:
             if code.startswith(prefix):
                 code = code[len(prefix):].strip()
 
-        payload = json.dumps({"code": code})
-
         try:
-            response = requests.post(self.http_server + "/run_python", headers={'Content-Type': 'application/json'},
-                                        data=payload, timeout=300)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"status": "error", "message": "Failed to execute command.", "output": None, "error": response.json()["error"]}
+            return get_vm_client(self.http_server).run_python(code, kernel_id=self.kernel_id)
         except Exception as e:
             logger.error(f"An error occurred while trying to execute the command: {traceback.format_exc()}")
             raise e
@@ -440,40 +538,8 @@ class CuaToolSet:
         wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0)
     )
     def _execute_terminal_command(self, command: str, timeout: int = 300) -> dict:
-        payload = json.dumps({
-            "script": command,
-            "timeout": timeout
-        })
         try:
-            response = requests.post(
-                self.http_server + "/run_bash_script", 
-                headers={'Content-Type': 'application/json'},
-                data=payload, 
-                timeout=timeout,
-            )
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Bash script executed successfully with return code: {result.get('returncode', -1)}")
-                return result
-            elif response.status_code == 400:
-                return {
-                    "status": "error",
-                    "output": "",
-                    "error": f"Scipt execution failed with status code : {response.status_code}, error: {response.text}",
-                    "returncode": -1
-                }
-            else:
-                logger.error(f"Failed to execute bash script. Status code: {response.status_code}, response: {response.text}")
-                raise Exception("Failed to execute bash script.")
-            
-        except requests.exceptions.ReadTimeout:
-            logger.error("Bash script execution timed out")
-            return {
-                "status": "error",
-                "output": "",
-                "error": f"Script execution timed out after {timeout} seconds",
-                "returncode": -1
-            }
+            return get_vm_client(self.http_server).run_bash_script(command, timeout=timeout)
         except Exception as e:
             logger.error(f"An error occurred while trying to execute the bash script: {e}")
             raise e
@@ -574,9 +640,11 @@ class CuaToolSetNativeLocalization(CuaToolSet):
         ):
         # Don't call super().__init__ to avoid requiring grounder
         self.http_server = http_server
+        self.kernel_id = str(uuid4())  # python interpreter of this tool set on the VM, in kernel mode
         self.enable_python_execution_tool = enable_python_execution_tool
         self.enable_terminal_command_tool = enable_terminal_command_tool
         self.grounder = grounder  # Optional, not used in this class
+        self._pregrounded = {}
 
         if self.enable_python_execution_tool or self.enable_terminal_command_tool:
             if not self.http_server:
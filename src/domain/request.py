@@ -1,8 +1,11 @@
-from typing import Any, Optional
+from datetime import datetime
+from typing import Any, Literal, Optional
 
 import openai
 from pydantic import BaseModel
 
+from screenshot import ImageCodec, ScreenshotDedupe
+
 # ===== AGENT PREDICTION =====
 
 class AgentPredictionRequest(BaseModel):
@@ -68,6 +71,23 @@ class AgentPredictionResponseLog(AgentPredictionResponse):
 class InitRequest(BaseModel):
     agent: str
     vm_http_server: Optional[str] = None
+    image_codec: Optional[ImageCodec] = None # how screenshots are encoded for the model, defaults to the original encoding
+    screenshot_dedupe: Optional[ScreenshotDedupe] = None # handling of screenshots identical to the previous one, defaults to 'off'
+    speculative_planning: Optional[bool] = None # prefetch the next plan during non-visual actions (hybrid agents), defaults to off
+    response_chaining: Optional[bool] = None # send only new items with previous_response_id to the planner (hybrid agents), defaults to off
 
 class SetTaskRequest(BaseModel):
     task: str
+
+
+# ===== LEARNING JOBS
+class LearningJob(BaseModel):
+    id: str
+    session_id: str
+    task_id: Optional[str] = None
+    agent: str
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# next to the skill book, whose descriptions are most of what gets embedded
+_DEFAULT_CACHE_PATH = Path(__file__).parent / "agents" / "hybrid" / "skill_agent_2" / ".cache" / "embeddings.sqlite"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(_DEFAULT_CACHE_PATH))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+# rows kept in the sqlite file, the oldest inserted are pruned beyond it
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000"))
+_PRUNE_RATIO = 0.9  # prune down to this share of max_rows, so not every insert prunes
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an in-memory LRU in front of a sqlite file.
+
+    Entries are keyed by a hash of the embedding model and the text, so they stay valid across processes
+    and runs. Vectors are kept as float32 arrays in memory and as raw float32 bytes on disk.
+    Pass `path=None` to only cache in memory. The file holds at most max_rows vectors, the oldest inserted
+    ones are deleted first.
+    """
+
+    def __init__(self, path: str | None = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_SIZE, max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._rows = 0  # rows in the sqlite file, an upper bound between prunes
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, model: str, texts: list[str]) -> list[np.ndarray | None]:
+        """Return the cached embedding of every text, or None where it is not cached."""
+        keys = [self.key(model, text) for text in texts]
+        with self._lock:
+            found = {key: self._memory[key] for key in keys if key in self._memory}
+            for key in found:
+                self._memory.move_to_end(key)
+
+            missing = list({key for key in keys if key not in found})
+            if missing and self._connect() is not None:
+                for key, blob in self._select(missing):
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(key, found[key])
+
+            results = [found.get(key) for key in keys]
+            hit_count = sum(result is not None for result in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+            return results
+
+    def put_many(self, model: str, texts: list[str], embeddings: list[np.ndarray]):
+        entries = [
+            (self.key(model, text), np.asarray(embedding, dtype=np.float32))
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            for key, embedding in entries:
+                self._remember(key, embedding)
+            if self._connect() is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, embedding.tobytes()) for key, embedding in entries],
+                )
+                self._rows += len(entries)
+                if self._rows > self.max_rows:
+                    self._prune()
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries_in_memory": len(self._memory)}
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self):
+        self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._rows - int(self.max_rows * _PRUNE_RATIO)
+        if self._rows <= self.max_rows or excess <= 0:
+            return
+        # INSERT OR REPLACE gives replaced rows a new rowid, so the lowest rowids were inserted first
+        self._db.execute("DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)", (excess,))
+        self._rows -= excess
+
+    def _select(self, keys: list[str]) -> list[tuple[str, bytes]]:
+        rows = []
+        # stay below sqlite's limit of bound parameters per statement
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows.extend(self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return rows
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+            self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._db
@@ -0,0 +1,76 @@
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from uuid import uuid4
+
+from loguru import logger
+
+from agents.agent import Agent
+from domain.request import LearningJob
+
+LEARNING_WORKERS = int(os.getenv("LEARNING_WORKERS", "2"))
+MAX_FINISHED_LEARNING_JOBS = int(os.getenv("MAX_FINISHED_LEARNING_JOBS", "1000"))
+
+
+class LearningJobQueue:
+    """
+    Runs `agent.end_task` (reflection + skill book learning) in a background worker pool,
+    so the end_task request returns immediately and the VM can start the next task.
+    A submitted agent belongs to its job, callers must not use it anymore.
+    """
+
+    def __init__(self, workers: int = LEARNING_WORKERS, max_finished_jobs: int = MAX_FINISHED_LEARNING_JOBS):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="learning-worker")
+        self._jobs: OrderedDict[str, LearningJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, agent: Agent, session_id: str, task_id: str = None) -> LearningJob:
+        job = LearningJob(
+            id=str(uuid4()),
+            session_id=session_id,
+            task_id=task_id,
+            agent=agent.name,
+            created_at=datetime.now(),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+            # copied before the worker can update the job
+            queued_job = job.model_copy()
+        self._executor.submit(self._run, job, agent)
+        logger.info(f"Queued learning job '{job.id}' for task '{task_id}' of session '{session_id}'")
+        return queued_job
+
+    def get(self, job_id: str) -> LearningJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.model_copy() if job is not None else None
+
+    def _run(self, job: LearningJob, agent: Agent):
+        with self._lock:
+            job.status = "running"
+            job.started_at = datetime.now()
+        try:
+            agent.end_task(task_id=job.task_id)
+            status, error = "done", None
+        except Exception as e:
+            logger.error(f"Learning job '{job.id}' failed: {traceback.format_exc()}")
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        # the session let go of the agent when the job was submitted
+        agent.close()
+
+        with self._lock:
+            job.status = status
+            job.error = error
+            job.finished_at = datetime.now()
+        logger.info(f"Learning job '{job.id}' finished with status '{status}'")
+
+    def _prune(self):
+        """Forget the oldest finished jobs, so the job history does not grow without bound."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
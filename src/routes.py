@@ -1,56 +1,152 @@
+import asyncio
 from datetime import datetime
 from typing import Annotated
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
 from loguru import logger
 
 from agents.agent import Agent
 from agents.agent_factory import build_agent
-from domain.request import AgentPredictionRequest, AgentPredictionResponse, AgentPredictionResponseLog, InitRequest, SetTaskRequest
+from agents.grounders.grounder_factory import routing_stats
+from agents.grounders.grounding_cache import get_grounding_cache
+from domain.request import AgentPredictionRequest, AgentPredictionResponse, AgentPredictionResponseLog, InitRequest, LearningJob, SetTaskRequest
+from learning_jobs import LearningJobQueue
+from screenshot import Screenshot
+from session_registry import SessionRegistry
 from utils import fix_pyautogui_script, log_agent_response
 
 
-# Session storage for agents and tasks
-sessions: dict[str, dict] = {}
+# Session storage for agents and tasks (bounded, evicts idle and least recently used sessions)
+sessions = SessionRegistry()
+
+# Background workers running end_task learning (reflection, skill book updates)
+learning_jobs = LearningJobQueue()
 
 # Reusable session_id dependency
 SessionId = Annotated[str, Query(..., description="Unique session identifier")]
 
 
-def get_session(session_id: SessionId) -> dict:
-    if session_id not in sessions:
+# dependencies are async so they do not occupy a threadpool worker
+async def get_session(session_id: SessionId) -> dict:
+    session = sessions.get(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found. Call 'POST /init?session_id={session_id}' first.")
-    return sessions[session_id]
+    return session
 
 
-def get_agent(session: dict = Depends(get_session)) -> Agent:
+async def get_agent(session: dict = Depends(get_session)) -> Agent:
     agent = session.get("agent")
     if agent is None:
-        raise HTTPException(status_code=500, detail="Agent not initialized.")
+        raise _missing_agent_error(session)
     return agent
 
 
-def get_task(session: dict = Depends(get_session)) -> str:
+def _missing_agent_error(session: dict) -> HTTPException:
+    if session.get("learning_job_id") is not None:
+        # the agent was handed over to its learning job by end_task
+        return HTTPException(status_code=409, detail=f"The task of this session has ended (learning job '{session['learning_job_id']}'). Call 'POST /reset' first.")
+    return HTTPException(status_code=500, detail="Agent not initialized.")
+
+
+async def get_task(session: dict = Depends(get_session)) -> str:
     task = session.get("task")
     if task is None:
         raise HTTPException(status_code=400, detail="Task not initialized. Call endpoint 'POST /task'")
     return task
 
 
+async def read_screenshot_upload(request: Request) -> Screenshot:
+    """
+    Read the screenshot of a binary predict request, sent either as the 'screenshot' file of a multipart/form-data
+    body or as the raw image body (e.g. image/png). The bytes are handed over as they are, base64 is only
+    produced once a model client needs it.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("screenshot")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected the screenshot as file field 'screenshot'.")
+        data = await upload.read()
+    elif content_type.startswith("image/") or content_type.startswith("application/octet-stream"):
+        data = await request.body()
+    else:
+        raise HTTPException(status_code=415, detail="Send the screenshot as multipart/form-data or as raw image bytes (e.g. image/png).")
+
+    if not data:
+        raise HTTPException(status_code=400, detail="Screenshot is empty.")
+    return Screenshot.from_bytes(data)
+
+
+async def run_prediction(session: dict, task: str, screenshot: str | Screenshot, task_id: str = None, domain: str = None) -> AgentPredictionResponse:
+    # requests of the same session are queued, not run at once
+    async with session["lock"]:
+        # the agent might have been replaced by a reset or handed to a learning job while waiting for the lock
+        agent = session["agent"]
+        if agent is None:
+            raise _missing_agent_error(session)
+        session["predict_count"] += 1
+        start_time = datetime.now()
+        result = await agent.apredict(screenshot=screenshot, task=task)
+        end_time = datetime.now()
+    duration = (end_time - start_time).total_seconds()
+    logger.info(f"Prediction {session['predict_count']} of task '{task_id}' ({domain}) took {duration:.1f}s")
+
+    result.pyautogui_actions = fix_pyautogui_script(result.pyautogui_actions) 
+
+    # agent_response_log = AgentPredictionResponseLog(
+    #     **result.model_dump(),
+    #     duration=duration,
+    #     task_id=task_id,
+    #     task=task,
+    #     domain=domain,
+    # )
+    # log_agent_response(agent_name=agent.name, agent_response_log=agent_response_log, start_new=(session["predict_count"] == 1))
+
+    result.time_thinking = duration
+    return result
+
+
 def include_routes(app: FastAPI):
     @app.get("/status", status_code=200)
     def status():
         return {"status": "ok"}
 
+    @app.get("/sessions", status_code=200)
+    async def list_sessions():
+        # runs on the event loop, so no agent history is mutated by a coroutine while it is walked
+        return sessions.describe()
+
+    @app.get("/grounding_cache", status_code=200)
+    def grounding_cache_stats():
+        return get_grounding_cache().stats()
+
+    @app.get("/grounding_routers", status_code=200)
+    def grounding_router_stats():
+        # latency, error and hedging statistics per backend of the process-wide grounding routers
+        return routing_stats()
+
     @app.post("/init", status_code=200)
     def init(init_request: InitRequest, session_id: SessionId):
         agent = build_agent(
             agent_type=init_request.agent,
             vm_http_server=init_request.vm_http_server,
+            image_codec=init_request.image_codec,
+            screenshot_dedupe=init_request.screenshot_dedupe,
+            speculative_planning=init_request.speculative_planning,
+            response_chaining=init_request.response_chaining,
         )
+        # keep the lock of an existing session, so in-flight requests stay serialized with new ones
+        existing_session = sessions.get(session_id)
+        lock = existing_session["lock"] if existing_session is not None else asyncio.Lock()
         sessions[session_id] = {
+            "lock": lock,
             "agent": agent,
             "agent_type": init_request.agent,
             "vm_http_server": init_request.vm_http_server,
+            "image_codec": init_request.image_codec,
+            "screenshot_dedupe": init_request.screenshot_dedupe,
+            "speculative_planning": init_request.speculative_planning,
+            "response_chaining": init_request.response_chaining,
             "task": None,
             "predict_count": 0
         }
@@ -63,45 +159,64 @@ def include_routes(app: FastAPI):
         session["task"] = set_task_request.task
 
     @app.post("/reset", status_code=200)
-    def reset(session: dict = Depends(get_session)):
+    async def reset(session: dict = Depends(get_session)):
         agent_type = session.get("agent_type")
         vm_http_server = session.get("vm_http_server")
         if agent_type is None:
             raise HTTPException(status_code=500, detail="Agent not initialized.")
         
-        # Create a new agent instance instead of calling reset()
-        new_agent = build_agent(
-            agent_type=agent_type,
-            vm_http_server=vm_http_server,
-        )
-        logger.info(f"Reset agent: '{new_agent.name}' (reinitialized)")
-        session["agent"] = new_agent
-        session["task"] = None
-        session["predict_count"] = 0
+        async with session["lock"]:
+            # Create a new agent instance instead of calling reset()
+            new_agent = await asyncio.to_thread(
+                build_agent,
+                agent_type=agent_type,
+                vm_http_server=vm_http_server,
+                image_codec=session.get("image_codec"),
+                screenshot_dedupe=session.get("screenshot_dedupe"),
+                speculative_planning=session.get("speculative_planning"),
+                response_chaining=session.get("response_chaining"),
+            )
+            logger.info(f"Reset agent: '{new_agent.name}' (reinitialized)")
+            if session["agent"] is not None:
+                session["agent"].close()
+            session["agent"] = new_agent
+            session["learning_job_id"] = None
+            session["task"] = None
+            session["predict_count"] = 0
 
     @app.post("/predict", status_code=200)
-    def predict(prediction_request: AgentPredictionRequest, agent: Agent = Depends(get_agent), task: str = Depends(get_task), session: dict = Depends(get_session)) -> AgentPredictionResponse:
-        session["predict_count"] += 1
-        start_time = datetime.now()
-        result = agent.predict(screenshot=prediction_request.screenshot, task=task)
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-
-        result.pyautogui_actions = fix_pyautogui_script(result.pyautogui_actions) 
-
-        # agent_response_log = AgentPredictionResponseLog(
-        #     **result.model_dump(),
-        #     duration=duration,
-        #     task_id=prediction_request.task_id,
-        #     task=task,
-        #     domain=prediction_request.domain,
-        # )
-        # log_agent_response(agent_name=agent.name, agent_response_log=agent_response_log, start_new=(session["predict_count"] == 1))
-
-        result.time_thinking = duration
-        return result
+    async def predict(prediction_request: AgentPredictionRequest, agent: Agent = Depends(get_agent), task: str = Depends(get_task), session: dict = Depends(get_session)) -> AgentPredictionResponse:
+        return await run_prediction(session, task, prediction_request.screenshot, task_id=prediction_request.task_id, domain=prediction_request.domain)
+
+    @app.post("/predict/binary", status_code=200)
+    async def predict_binary(
+        task_id: str = Query(None, description="Task identifier"),
+        domain: str = Query(None, description="Task domain"),
+        screenshot: Screenshot = Depends(read_screenshot_upload),
+        agent: Agent = Depends(get_agent),
+        task: str = Depends(get_task),
+        session: dict = Depends(get_session),
+    ) -> AgentPredictionResponse:
+        # same as /predict, but the screenshot is uploaded as binary instead of base64 inside JSON
+        return await run_prediction(session, task, screenshot, task_id=task_id, domain=domain)
 
     @app.post("/end_task", status_code=200)
-    def end_task(task_id: str = Query(None, description="Task identifier"), session: dict = Depends(get_session)):
-        agent = session.get("agent")
-        agent.end_task(task_id=task_id)
\ No newline at end of file
+    async def end_task(session_id: SessionId, task_id: str = Query(None, description="Task identifier"), session: dict = Depends(get_session)) -> LearningJob:
+        # learning runs in the background, poll 'GET /learning_jobs/{job_id}' for its status
+        async with session["lock"]:
+            agent = session.get("agent")
+            if agent is None:
+                raise _missing_agent_error(session)
+            job = learning_jobs.submit(agent=agent, session_id=session_id, task_id=task_id)
+            # the job owns the agent from now on, the session takes new predictions only after a reset
+            session["agent"] = None
+            session["task"] = None
+            session["learning_job_id"] = job.id
+            return job
+
+    @app.get("/learning_jobs/{job_id}", status_code=200)
+    async def get_learning_job(job_id: str) -> LearningJob:
+        job = learning_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Learning job '{job_id}' not found.")
+        return job
\ No newline at end of file
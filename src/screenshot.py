@@ -0,0 +1,264 @@
+import base64
+import hashlib
+import io
+import threading
+from typing import Literal
+
+from PIL import Image, ImageChops
+from pydantic import BaseModel, Field
+
+_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+_MAGIC_BYTES = ((b"\x89PNG", "PNG"), (b"\xff\xd8", "JPEG"), (b"RIFF", "WEBP"))
+_THUMBNAIL_SIZE = (160, 90)  # each pixel averages a 12x12 block of a 1920x1080 screenshot
+
+
+# How agents handle a screenshot that is visually identical to the previous one:
+# off - send it like any other, reference - reuse the previous screenshot (no new bytes held or encoded),
+# text - send a short "screen unchanged" note instead of the image
+ScreenshotDedupe = Literal["off", "reference", "text"]
+
+
+class ImageCodec(BaseModel):
+    """
+    How an agent encodes screenshots for its model, trading payload size for fidelity.
+    The default keeps the original encoding (only resizing if the agent needs another size).
+    """
+    format: Literal["PNG", "JPEG", "WEBP"] | None = None  # None keeps the format of the screenshot
+    quality: int | None = Field(default=None, ge=1, le=100)  # JPEG / WebP
+    compress_level: int | None = Field(default=None, ge=0, le=9)  # PNG
+    grayscale: bool = False
+
+    def options(self) -> dict:
+        """Keyword arguments for `Screenshot.encode`, `to_base64` and `data_url`."""
+        options = {"format": self.format, "grayscale": self.grayscale}
+        if self.quality is not None and self.format in ("JPEG", "WEBP"):
+            options["quality"] = self.quality
+        if self.compress_level is not None and self.format in ("PNG", None):
+            options["compress_level"] = self.compress_level
+        return options
+
+
+def mime_type(image_format: str) -> str:
+    return _MIME_TYPES.get(_normalize_format(image_format), "image/png")
+
+
+class Screenshot:
+    """
+    Screenshot of one step, decoded at most once.
+
+    Derived variants (resized images, encodings and their base64 strings) are cached by target size,
+    format and encoder parameters, so the planner, the grounder(s) and the history of a step share a single
+    decode. Requesting the original size and format returns the original bytes without re-encoding.
+
+    Instances are thread-safe and must be treated as immutable.
+    """
+
+    def __init__(self, data: bytes = None, b64: str = None):
+        if data is None and b64 is None:
+            raise ValueError("Screenshot needs either the encoded image bytes or their base64 string")
+        self._data = data
+        self._b64 = b64
+        self._image: Image.Image | None = None
+        self._resized: dict[tuple[int, int], Image.Image] = {}
+        self._encoded: dict[tuple, bytes] = {}
+        self._encoded_b64: dict[tuple, str] = {}
+        self._data_urls: dict[tuple, str] = {}
+        self._thumbnail: Image.Image | None = None
+        self._perceptual_hash: str | None = None
+        self._crops: dict[tuple[int, int, int, int], Screenshot] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_base64(cls, b64: str) -> "Screenshot":
+        return cls(b64=b64)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Screenshot":
+        return cls(data=data)
+
+    @classmethod
+    def of(cls, screenshot: "str | bytes | Screenshot | None") -> "Screenshot | None":
+        """Wrap a base64 string or encoded bytes, Screenshot instances (and None) are returned as they are."""
+        if screenshot is None or isinstance(screenshot, Screenshot):
+            return screenshot
+        if isinstance(screenshot, (bytes, bytearray, memoryview)):
+            return cls.from_bytes(bytes(screenshot))
+        return cls.from_base64(screenshot)
+
+    @property
+    def data(self) -> bytes:
+        """The original encoded image."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = base64.b64decode(self._b64)
+        return self._data
+
+    @property
+    def base64(self) -> str:
+        """The original encoded image as base64 string."""
+        if self._b64 is None:
+            with self._lock:
+                if self._b64 is None:
+                    self._b64 = base64.b64encode(self._data).decode("utf-8")
+        return self._b64
+
+    @property
+    def format(self) -> str:
+        """Format of the original encoding, e.g. PNG or JPEG."""
+        # the magic bytes are in the first 12 base64 characters, no need to decode everything
+        head = self._data[:8] if self._data is not None else base64.b64decode(self._b64[:12])
+        for magic, image_format in _MAGIC_BYTES:
+            if head.startswith(magic):
+                return image_format
+        return self.image.format or "PNG"
+
+    @property
+    def image(self) -> Image.Image:
+        """The decoded image."""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = Image.open(io.BytesIO(self.data))
+                    image.load()
+                    self._image = image
+        return self._image
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    def resized(self, size: tuple[int, int] = None) -> Image.Image:
+        """The decoded image resized (LANCZOS) to size, the original if size is None or the original size."""
+        if size is None or tuple(size) == self.size:
+            return self.image
+        size = tuple(size)
+        with self._lock:
+            if size not in self._resized:
+                self._resized[size] = self.image.resize(size, Image.Resampling.LANCZOS)
+            return self._resized[size]
+
+    def crop(self, box: tuple[int, int, int, int]) -> "Screenshot":
+        """The region box = (left, top, right, bottom) in pixels as a new screenshot, encoded in the original format."""
+        box = tuple(box)
+        with self._lock:
+            if box not in self._crops:
+                image = self.image.crop(box)
+                buffer = io.BytesIO()
+                image.save(buffer, format=self.format)
+                self._crops[box] = Screenshot.from_bytes(buffer.getvalue())
+            return self._crops[box]
+
+    def encode(self, size: tuple[int, int] = None, format: str = None, grayscale: bool = False, **params) -> bytes:
+        """
+        Encode the (resized) image.
+        :param size: target size, defaults to the original size
+        :param format: PIL format name, defaults to the original format
+        :param grayscale: convert to 8-bit grayscale before encoding
+        :param params: encoder parameters passed to `Image.save`, e.g. quality or compress_level
+        """
+        key = self._variant_key(size, format, grayscale, params)
+        if key is None:
+            return self.data
+        with self._lock:
+            if key not in self._encoded:
+                size, format, grayscale, params = key
+                params = dict(params)
+                image = self.resized(size)
+                if grayscale:
+                    image = image.convert("L")
+                elif format == "JPEG" and image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, format=format, **params)
+                self._encoded[key] = buffer.getvalue()
+            return self._encoded[key]
+
+    def to_base64(self, size: tuple[int, int] = None, format: str = None, grayscale: bool = False, **params) -> str:
+        """Base64 string of `encode(size, format, grayscale, **params)`."""
+        key = self._variant_key(size, format, grayscale, params)
+        if key is None:
+            return self.base64
+        with self._lock:
+            if key not in self._encoded_b64:
+                self._encoded_b64[key] = base64.b64encode(self.encode(size, format, grayscale, **params)).decode("utf-8")
+            return self._encoded_b64[key]
+
+    def mime_type(self, format: str = None) -> str:
+        """Mime type of the encoding in format, defaults to the original format."""
+        return mime_type(format or self.format)
+
+    def data_url(self, size: tuple[int, int] = None, format: str = None, grayscale: bool = False, **params) -> str:
+        """Data URL of `encode(size, format, grayscale, **params)` with the matching mime type."""
+        key = self._variant_key(size, format, grayscale, params)
+        with self._lock:
+            if key not in self._data_urls:
+                self._data_urls[key] = f"data:{self.mime_type(format)};base64,{self.to_base64(size, format, grayscale, **params)}"
+            return self._data_urls[key]
+
+    def thumbnail(self) -> Image.Image:
+        """Small grayscale version of the image for fast visual comparison."""
+        if self._thumbnail is None:
+            with self._lock:
+                if self._thumbnail is None:
+                    self._thumbnail = self.image.convert("L").resize(_THUMBNAIL_SIZE, Image.Resampling.BOX)
+        return self._thumbnail
+
+    def perceptual_hash(self) -> str:
+        """
+        Hash of the thumbnail quantized to 32 gray levels: re-encoded or slightly noisy captures of the same screen
+        usually share it, any visible change of the content does not.
+        """
+        if self._perceptual_hash is None:
+            quantized = bytes(value >> 3 for value in self.thumbnail().tobytes())
+            self._perceptual_hash = hashlib.sha1(quantized).hexdigest()
+        return self._perceptual_hash
+
+    def is_visually_identical(self, other: "Screenshot", tolerance: int = 8) -> bool:
+        """
+        Whether both screenshots show the same screen: identical bytes, or no pixel of the grayscale
+        thumbnails differs by more than tolerance (out of 255). Small changes such as a typed character
+        or a moved window still exceed the default tolerance.
+        """
+        if other is self:
+            return True
+        if self._b64 is not None and other._b64 is not None:
+            if self._b64 == other._b64:
+                return True
+        elif self.data == other.data:
+            return True
+        if self.size != other.size:
+            return False
+        _, max_difference = ImageChops.difference(self.thumbnail(), other.thumbnail()).getextrema()
+        return max_difference <= tolerance
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the screenshot and its cached variants."""
+        with self._lock:
+            total = len(self._data or b"") + len(self._b64 or "")
+            images = ([self._image] if self._image is not None else []) + list(self._resized.values())
+            total += sum(image.width * image.height * len(image.getbands()) for image in images)
+            total += sum(len(encoded) for encoded in self._encoded.values())
+            total += sum(len(encoded) for encoded in self._encoded_b64.values())
+            total += sum(len(data_url) for data_url in self._data_urls.values())
+            total += sum(crop.nbytes for crop in self._crops.values())
+            return total
+
+    def _variant_key(self, size: tuple[int, int] | None, format: str | None, grayscale: bool, params: dict) -> tuple | None:
+        """Cache key of a variant, None if it is the original encoding."""
+        original_format = self.format
+        format = _normalize_format(format or original_format)
+        params = {key: value for key, value in params.items() if value is not None}
+        is_original_encoding = format == original_format and not grayscale and not params
+        if size is None and is_original_encoding:
+            return None
+        size = tuple(size) if size is not None else self.size
+        if size == self.size and is_original_encoding:
+            return None
+        return size, format, grayscale, tuple(sorted(params.items()))
+
+
+def _normalize_format(image_format: str) -> str:
+    image_format = image_format.upper()
+    return "JPEG" if image_format == "JPG" else image_format
@@ -0,0 +1,71 @@
+"""
+Benchmark screenshot codecs: bytes sent per screenshot, encode time and the resulting upload time.
+
+Every codec encodes a fresh Screenshot (so nothing is served from its cache) at the given sizes.
+The payload is the base64 string, as it is sent inside the JSON request to Bedrock / OpenRouter / Azure.
+
+Usage (from src/):
+    python -m scripts.benchmark_image_codecs --image ../data/test-image.png --mbit 10 50
+"""
+import argparse
+import time
+from pathlib import Path
+
+from screenshot import ImageCodec, Screenshot
+
+_CODECS = {
+    "original": ImageCodec(),
+    "png-1": ImageCodec(format="PNG", compress_level=1),
+    "png-6": ImageCodec(format="PNG", compress_level=6),
+    "png-9": ImageCodec(format="PNG", compress_level=9),
+    "png-9-gray": ImageCodec(format="PNG", compress_level=9, grayscale=True),
+    "jpeg-95": ImageCodec(format="JPEG", quality=95),
+    "jpeg-85": ImageCodec(format="JPEG", quality=85),
+    "jpeg-70": ImageCodec(format="JPEG", quality=70),
+    "jpeg-70-gray": ImageCodec(format="JPEG", quality=70, grayscale=True),
+    "webp-90": ImageCodec(format="WEBP", quality=90),
+    "webp-75": ImageCodec(format="WEBP", quality=75),
+}
+
+
+def _parse_size(value: str) -> tuple[int, int] | None:
+    if value == "original":
+        return None
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(image: Path, sizes: list[str], mbits: list[float], repeats: int):
+    data = image.read_bytes()
+    original_size = Screenshot.from_bytes(data).size
+
+    for size_name in sizes:
+        size = _parse_size(size_name)
+        print(f"\n{image.name} {original_size[0]}x{original_size[1]} -> {size_name}")
+        header = f"{'codec':>13} | {'bytes':>10} | {'base64 bytes':>12} | {'encode (ms)':>11}"
+        header += "".join(f" | {f'upload @{mbit:g}Mbit (ms)':>20}" for mbit in mbits)
+        print(header)
+        print("-" * len(header))
+
+        for name, codec in _CODECS.items():
+            encode_ms = 0.0
+            for _ in range(repeats):
+                screenshot = Screenshot.from_bytes(data)
+                start = time.perf_counter()
+                b64 = screenshot.to_base64(size=size, **codec.options())
+                encode_ms += (time.perf_counter() - start) * 1000
+            encoded_bytes = len(screenshot.encode(size=size, **codec.options()))
+
+            row = f"{name:>13} | {encoded_bytes:>10,} | {len(b64):>12,} | {encode_ms / repeats:>11.1f}"
+            row += "".join(f" | {len(b64) * 8 / (mbit * 1e6) * 1000:>20.0f}" for mbit in mbits)
+            print(row)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", type=Path, default=Path(__file__).parents[2] / "data" / "test-image.png")
+    parser.add_argument("--sizes", nargs="+", default=["original", "1280x720"], help="'original' or WIDTHxHEIGHT")
+    parser.add_argument("--mbit", type=float, nargs="+", default=[10, 50], help="Uplink speeds to estimate upload time for")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    main(args.image, args.sizes, args.mbit, args.repeats)
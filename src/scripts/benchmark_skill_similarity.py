@@ -0,0 +1,75 @@
+"""
+Benchmark skill similarity query latency against the number of skills in a domain.
+
+Compares the previous pure-python cosine loop with the vectorized SkillEmbeddingIndex, using random
+embeddings of the dimension of text-embedding-3-large. No API calls are made.
+
+Usage (from src/):
+    python -m scripts.benchmark_skill_similarity --sizes 10 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from agents.hybrid.skill_agent_2.embedding_index import SkillEmbeddingIndex
+
+
+def _python_top_k(query: list[float], embeddings: list[list[float]], k: int, threshold: float) -> list[tuple[int, float]]:
+    """The loop SkillBook.find_similar_skills used before the index."""
+    similar = []
+    magnitude_query = sum(a * a for a in query) ** 0.5
+    for i, embedding in enumerate(embeddings):
+        dot_product = sum(a * b for a, b in zip(query, embedding))
+        magnitude = sum(b * b for b in embedding) ** 0.5
+        similarity = dot_product / (magnitude_query * magnitude) if magnitude_query and magnitude else 0.0
+        if similarity >= threshold:
+            similar.append((i, similarity))
+    similar.sort(key=lambda x: x[1], reverse=True)
+    return similar[:k]
+
+
+def _time_ms(fn, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main(sizes: list[int], dim: int, k: int, repeats: int, python_limit: int):
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(dim).astype(np.float32)
+
+    print(f"{'skills':>8} | {'index build (ms)':>16} | {'index query (ms)':>16} | {'python loop (ms)':>16} | {'speedup':>8}")
+    print("-" * 78)
+    for size in sizes:
+        embeddings = rng.standard_normal((size, dim)).astype(np.float32)
+
+        index = SkillEmbeddingIndex()
+        start = time.perf_counter()
+        for i, embedding in enumerate(embeddings):
+            index.upsert("bench", f"skill-{i}", embedding)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        index_ms = _time_ms(lambda: index.query("bench", query, k=k, threshold=-1.0), repeats)
+
+        if size <= python_limit:
+            embeddings_list = embeddings.tolist()
+            query_list = query.tolist()
+            python_ms = _time_ms(lambda: _python_top_k(query_list, embeddings_list, k=k, threshold=-1.0), max(1, repeats // 10))
+            python_col, speedup_col = f"{python_ms:16.3f}", f"{python_ms / index_ms:7.0f}x"
+        else:
+            python_col, speedup_col = f"{'skipped':>16}", f"{'-':>8}"
+
+        print(f"{size:>8} | {build_ms:16.1f} | {index_ms:16.3f} | {python_col} | {speedup_col}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=100)
+    parser.add_argument("--python-limit", type=int, default=1000, help="Largest size to run the python loop for")
+    args = parser.parse_args()
+    main(args.sizes, args.dim, args.k, args.repeats, args.python_limit)
@@ -0,0 +1,88 @@
+"""
+Stub OpenAI-compatible grounding server for testing LocalGrounder without a GPU.
+
+Answers `POST /v1/chat/completions` and the batch endpoint `POST /v1/chat/completions/batch` with a fixed
+coordinate per element description (derived from its hash, in the 0-1000 space of Qwen3-VL) after a
+configurable inference delay. A batch takes as long as a single request, like batched inference does.
+`GET /stats` reports how many requests arrived in how many calls.
+
+Usage (from src/):
+    python -m scripts.stub_grounding_server --port 8000 --delay-ms 300
+    LOCAL_GROUNDING_BASE_URL=http://127.0.0.1:8000/v1 GROUNDING_BACKEND=local python main.py
+"""
+import argparse
+import asyncio
+import hashlib
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI
+
+app = FastAPI()
+_stats = {"calls": 0, "batch_calls": 0, "requests": 0, "max_batch_size": 0}
+_delay_seconds = 0.3
+
+
+def _element_description(request: dict) -> str:
+    for message in reversed(request.get("messages", [])):
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "text":
+                match = re.search(r"described as: '(.*)'", part["text"], re.DOTALL)
+                return match.group(1) if match else part["text"]
+    return ""
+
+
+def _completion(request: dict) -> dict:
+    digest = hashlib.sha256(_element_description(request).encode()).digest()
+    x, y = digest[0] * 1000 // 256, digest[1] * 1000 // 256
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": f"The element is at ({x}, {y})"},
+        }],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 12, "total_tokens": 1012},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: dict):
+    _stats["calls"] += 1
+    _stats["requests"] += 1
+    _stats["max_batch_size"] = max(_stats["max_batch_size"], 1)
+    await asyncio.sleep(_delay_seconds)
+    return _completion(request)
+
+
+@app.post("/v1/chat/completions/batch")
+async def chat_completions_batch(batch: dict):
+    requests = batch.get("requests", [])
+    _stats["calls"] += 1
+    _stats["batch_calls"] += 1
+    _stats["requests"] += len(requests)
+    _stats["max_batch_size"] = max(_stats["max_batch_size"], len(requests))
+    await asyncio.sleep(_delay_seconds)
+    return {"responses": [_completion(request) for request in requests]}
+
+
+@app.get("/stats")
+def stats():
+    return _stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay-ms", type=float, default=300, help="Simulated inference time per call")
+    args = parser.parse_args()
+    _delay_seconds = args.delay_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port)
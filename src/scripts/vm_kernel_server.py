@@ -0,0 +1,194 @@
+"""
+Python kernel server for the VM, also usable as a local stand-in for the VM http server in tests.
+
+Serves the endpoints the tool sets call through VMClient:
+    POST /kernel/{kernel_id}/execute  {"code", "timeout"} - run in the persistent interpreter of kernel_id
+    DELETE /kernel/{kernel_id}                            - stop a kernel
+    POST /run_python                  {"code"}            - run in a fresh interpreter
+    POST /run_bash_script             {"script", "timeout"}
+    POST /run_bash_script_stream      {"script", "timeout"} - newline delimited JSON output events
+
+A kernel is a python subprocess that keeps its globals between snippets, so imports (pandas, openpyxl, docx)
+and loaded data are reused. Kernels are started on first use, restarted after a snippet times out and stopped
+after KERNEL_IDLE_TTL seconds without use.
+
+Usage (on the VM, or from src/ for local tests):
+    python -m scripts.vm_kernel_server --port 5001
+    VM_PYTHON_KERNEL=true, with the agent's vm_http_server pointing at this server
+"""
+import argparse
+import json
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+KERNEL_IDLE_TTL = 30 * 60
+
+# runs inside the kernel process: one JSON request per line on fd 0, one JSON result per line on fd 1.
+# The protocol keeps private duplicates of both fds, snippets get /dev/null as stdin and capture files as fds 1
+# and 2, so output of os.system, subprocesses or C extensions is captured too instead of corrupting the protocol.
+_KERNEL_SOURCE = r'''
+import json, os, sys, tempfile, traceback
+requests = os.fdopen(os.dup(0), "r", encoding="utf-8")
+results = os.fdopen(os.dup(1), "w", encoding="utf-8")
+devnull = os.open(os.devnull, os.O_RDWR)
+os.dup2(devnull, 0)
+os.dup2(devnull, 1)
+sys.stdin = open(os.devnull, "r")
+stderr_fd = os.dup(2)
+namespace = {"__name__": "__main__"}
+
+
+def capture(code):
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        os.dup2(stdout.fileno(), 1)
+        os.dup2(stderr.fileno(), 2)
+        status = "success"
+        try:
+            exec(compile(code, "<snippet>", "exec"), namespace)
+        except BaseException:
+            status = "error"
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(devnull, 1)
+            os.dup2(stderr_fd, 2)
+        stdout.seek(0)
+        stderr.seek(0)
+        return status, stdout.read().decode("utf-8", errors="replace"), stderr.read().decode("utf-8", errors="replace")
+
+
+for line in requests:
+    status, output, error = capture(json.loads(line)["code"])
+    results.write(json.dumps({"status": status, "output": output, "error": error}) + "\n")
+    results.flush()
+'''
+
+app = FastAPI()
+
+
+class _Kernel:
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "-c", _KERNEL_SOURCE],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+        )
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self._results: queue.Queue[str | None] = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self._results.put(line)
+        self._results.put(None)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def execute(self, code: str, timeout: float) -> dict:
+        with self.lock:
+            self.last_used = time.monotonic()
+            self.process.stdin.write(json.dumps({"code": code}) + "\n")
+            self.process.stdin.flush()
+            try:
+                line = self._results.get(timeout=timeout)
+            except queue.Empty:
+                self.stop()
+                return {"status": "error", "output": "", "error": f"Execution timed out after {timeout} seconds, the kernel was restarted"}
+            if line is None:
+                return {"status": "error", "output": "", "error": "The kernel exited, it is restarted on the next snippet"}
+            result = json.loads(line)
+            result["message"] = result["output"] if result["status"] == "success" else "Python code raised an exception"
+            return result
+
+    def stop(self):
+        self.process.kill()
+
+
+_kernels: dict[str, _Kernel] = {}
+_kernels_lock = threading.Lock()
+
+
+def _get_kernel(kernel_id: str) -> _Kernel:
+    with _kernels_lock:
+        now = time.monotonic()
+        for idle_id in [k for k, kernel in _kernels.items() if now - kernel.last_used > KERNEL_IDLE_TTL and not kernel.lock.locked()]:
+            _kernels.pop(idle_id).stop()
+        kernel = _kernels.get(kernel_id)
+        if kernel is None or not kernel.alive:
+            kernel = _kernels[kernel_id] = _Kernel()
+        return kernel
+
+
+@app.post("/kernel/{kernel_id}/execute")
+def execute(kernel_id: str, request: dict):
+    return _get_kernel(kernel_id).execute(request["code"], float(request.get("timeout", 300)))
+
+
+@app.delete("/kernel/{kernel_id}")
+def stop_kernel(kernel_id: str):
+    with _kernels_lock:
+        kernel = _kernels.pop(kernel_id, None)
+    if kernel is not None:
+        kernel.stop()
+    return {"status": "success"}
+
+
+@app.post("/run_python")
+def run_python(request: dict):
+    try:
+        completed = subprocess.run([sys.executable, "-c", request["code"]], capture_output=True, text=True, timeout=300)
+    except subprocess.TimeoutExpired:
+        return {"status": "error", "message": "Execution timed out", "output": "", "error": "Execution timed out after 300 seconds"}
+    status = "success" if completed.returncode == 0 else "error"
+    return {"status": status, "message": completed.stdout, "output": completed.stdout, "error": completed.stderr}
+
+
+@app.post("/run_bash_script")
+def run_bash_script(request: dict):
+    timeout = float(request.get("timeout", 300))
+    try:
+        completed = subprocess.run(["bash", "-c", request["script"]], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "error", "output": "", "error": f"Script execution timed out after {timeout} seconds", "returncode": -1}
+    status = "success" if completed.returncode == 0 else "error"
+    return {"status": status, "output": completed.stdout, "error": completed.stderr, "returncode": completed.returncode}
+
+
+@app.post("/run_bash_script_stream")
+def run_bash_script_stream(request: dict):
+    timeout = float(request.get("timeout", 300))
+    process = subprocess.Popen(
+        ["bash", "-c", request["script"]], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    )
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+
+    def events():
+        try:
+            for line in process.stdout:
+                yield json.dumps({"output": line}) + "\n"
+            yield json.dumps({"returncode": process.wait()}) + "\n"
+        finally:
+            # also reached when the client stops reading early
+            timer.cancel()
+            process.kill()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))
+SESSION_IDLE_TTL_SECONDS = float(os.getenv("SESSION_IDLE_TTL_SECONDS", str(6 * 60 * 60)))
+
+
+class SessionRegistry:
+    """
+    Bounded store for agent sessions.
+
+    Sessions idle for longer than `idle_ttl` seconds are evicted, and once more than `max_sessions`
+    are stored the least recently used ones are evicted. Sessions with a request in flight
+    (i.e. their lock is held) are never evicted.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+        self._last_access: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def __getitem__(self, session_id: str) -> dict:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session: dict):
+        self.put(session_id, session)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> dict | None:
+        """Return the session and mark it as recently used, or None if it does not exist (anymore)."""
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+            return session
+
+    def put(self, session_id: str, session: dict):
+        with self._lock:
+            replaced = self._sessions.get(session_id)
+            if replaced is not None and replaced.get("agent") is not session.get("agent"):
+                _close_agent(replaced)
+            self._sessions[session_id] = session
+            self._touch(session_id)
+            self._evict_idle()
+            self._evict_lru()
+
+    def remove(self, session_id: str) -> dict | None:
+        with self._lock:
+            self._last_access.pop(session_id, None)
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                _close_agent(session)
+            return session
+
+    def _touch(self, session_id: str):
+        self._last_access[session_id] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def _idle_seconds(self, session_id: str) -> float:
+        return time.monotonic() - self._last_access.get(session_id, 0.0)
+
+    def _evict(self, session_id: str, reason: str):
+        _close_agent(self._sessions.pop(session_id))
+        self._last_access.pop(session_id, None)
+        logger.info(f"Evicted session '{session_id}' ({reason})")
+
+    def _evict_idle(self):
+        if self.idle_ttl is None or self.idle_ttl <= 0:
+            return
+        for session_id in list(self._sessions.keys()):
+            if self._idle_seconds(session_id) > self.idle_ttl and not _is_busy(self._sessions[session_id]):
+                self._evict(session_id, reason=f"idle for more than {self.idle_ttl:.0f}s")
+
+    def _evict_lru(self):
+        # iterate from least to most recently used
+        for session_id in list(self._sessions.keys()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not _is_busy(self._sessions[session_id]):
+                self._evict(session_id, reason=f"more than {self.max_sessions} sessions")
+
+    def describe(self) -> dict:
+        """JSON-friendly overview of all sessions including a memory estimate of their agents."""
+        with self._lock:
+            self._evict_idle()
+            entries = [(session_id, session, self._idle_seconds(session_id)) for session_id, session in self._sessions.items()]
+
+        sessions = []
+        totals = {"history_bytes": 0, "screenshot_bytes": 0, "screenshots": 0}
+        for session_id, session, idle_seconds in entries:
+            agent = session.get("agent")
+            memory = agent.estimate_memory() if agent is not None else {key: 0 for key in totals}
+            for key in totals:
+                totals[key] += memory.get(key, 0)
+            sessions.append({
+                "session_id": session_id,
+                "agent_type": session.get("agent_type"),
+                "agent": agent.name if agent is not None else None,
+                "has_task": session.get("task") is not None,
+                "learning_job_id": session.get("learning_job_id"),
+                "predict_count": session.get("predict_count", 0),
+                "busy": _is_busy(session),
+                "idle_seconds": round(idle_seconds, 1),
+                "memory": memory,
+                "metrics": agent.get_metrics() if agent is not None else {},
+            })
+
+        return {
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "count": len(sessions),
+            "memory": totals,
+            "sessions": sessions,
+        }
+
+
+def _close_agent(session: dict):
+    agent = session.get("agent")
+    if agent is not None:
+        agent.close()
+
+
+def _is_busy(session: dict) -> bool:
+    lock = session.get("lock")
+    return lock is not None and lock.locked()
@@ -1,13 +1,24 @@
 import os
 import re
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
 from loguru import logger
+import numpy as np
 import openai
 from functools import lru_cache
+from tenacity import retry, stop_after_attempt, wait_exponential
 from domain.request import AgentPredictionResponseLog, AgentPredictionResponseLog
+from embedding_cache import EmbeddingCache
+from screenshot import Screenshot
 
 VIEWPORT_SIZE = (1920, 1080)
 LOGS_DIR = "logs"
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))  # the API allows 300k per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "512"))  # the API allows 2048 inputs per request
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
 
 def expect_env_var(env_name: str) -> str:
     val = os.getenv(env_name)
@@ -104,7 +115,8 @@ def fix_pyautogui_script(pyautogui_script: str) -> str:
     return "\n".join(fixed_lines)
 
 def convert_to_base64_image_url(b64_image: str) -> str:
-    return f"data:image/png;base64,{b64_image}"
+    # label with the actual format (detected from the magic bytes) instead of always image/png
+    return Screenshot.from_base64(b64_image).data_url()
 
 def log_agent_response(agent_name: str, agent_response_log: AgentPredictionResponseLog, start_new: bool = False):
     log_file_path = os.path.join(LOGS_DIR, agent_name, f"{agent_response_log.task_id}.jsonl")
@@ -121,17 +133,102 @@ def get_openai_client() -> openai.OpenAI:
         api_key=expect_env_var("AZURE_OPENAI_API_KEY"),
     )
 
-def create_embeddings(text: str | list[str]) -> list[list[float]]:
-    client = get_openai_client()
-    
-    input_text = text if isinstance(text, list) else [text]
-    
-    response = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=input_text
+@lru_cache(maxsize=1)
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    return openai.AsyncOpenAI(
+        base_url=expect_env_var("AZURE_OPENAI_BASE_URL"),
+        api_key=expect_env_var("AZURE_OPENAI_API_KEY"),
     )
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache:
+    return EmbeddingCache()
+
+def create_embeddings(text: str | list[str], model: str = EMBEDDING_MODEL) -> list[np.ndarray]:
+    """Embed one or more texts. Cached embeddings are reused, only the misses are sent to the API."""
+    input_text = text if isinstance(text, list) else [text]
+    cache = get_embedding_cache()
+
+    embeddings = cache.get_many(model, input_text)
+    missing = list(dict.fromkeys(t for t, embedding in zip(input_text, embeddings) if embedding is None))
+    if missing:
+        response = get_openai_client().embeddings.create(
+            model=model,
+            input=missing
+        )
+        new_embeddings = [np.asarray(embedding.embedding, dtype=np.float32) for embedding in response.data]
+        cache.put_many(model, missing, new_embeddings)
+
+        by_text = dict(zip(missing, new_embeddings))
+        embeddings = [by_text[t] if embedding is None else embedding for t, embedding in zip(input_text, embeddings)]
     
-    return [embedding.embedding for embedding in response.data]
+    return embeddings
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text, good enough to stay below the request limits
+    return len(text) // 4 + 1
+
+def _batch_by_token_budget(texts: list[str], max_tokens: int, max_size: int) -> list[list[int]]:
+    """Split the text indices into consecutive batches of at most max_tokens (estimated) and max_size texts."""
+    batches, batch, batch_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = _estimate_tokens(text)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+@retry(
+    reraise=True,
+    stop=stop_after_attempt(4),
+    wait=wait_exponential(multiplier=1.0, min=1.0, max=8.0),
+)
+def _create_embeddings_with_retry(texts: list[str], model: str) -> list[np.ndarray]:
+    return create_embeddings(texts, model=model)
+
+def create_embeddings_batched(
+        texts: list[str],
+        model: str = EMBEDDING_MODEL,
+        on_batch: Callable[[list[int], list[np.ndarray]], None] = None,
+        max_tokens_per_batch: int = EMBEDDING_BATCH_TOKENS,
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_workers: int = EMBEDDING_WORKERS,
+) -> list[np.ndarray]:
+    """
+    Embed many texts in token-budgeted batches, which are sent in parallel and retried individually.
+    :param on_batch: called with (text indices, embeddings) after each successful batch, in the calling thread
+    :return: embeddings in the order of the texts
+    :raises: the first batch error, after all other batches have finished (and were passed to on_batch)
+    """
+    batches = _batch_by_token_budget(texts, max_tokens_per_batch, max_batch_size)
+    results: list[np.ndarray | None] = [None] * len(texts)
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        futures = {
+            executor.submit(_create_embeddings_with_retry, [texts[i] for i in batch], model): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} texts failed: {e}")
+                error = error or e
+                continue
+            for i, embedding in zip(batch, embeddings):
+                results[i] = embedding
+            if on_batch is not None:
+                on_batch(batch, embeddings)
+
+    if error is not None:
+        raise error
+    return results
 
 def get_tool_calls_from_response(response) -> list:
     return list(filter(lambda o: o.type == "function_call", response.output))
\ No newline at end of file
@@ -0,0 +1,253 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+VM_POOL_MAXSIZE = int(os.getenv("VM_POOL_MAXSIZE", "8"))  # keep-alive connections per VM server
+VM_CONNECT_TIMEOUT = float(os.getenv("VM_CONNECT_TIMEOUT", "5"))
+# budget of command output kept for the agent history, split evenly between head and tail
+VM_OUTPUT_MAX_BYTES = int(os.getenv("VM_OUTPUT_MAX_BYTES", "16000"))
+VM_OUTPUT_MAX_LINES = int(os.getenv("VM_OUTPUT_MAX_LINES", "200"))
+# stop reading a streamed command output after this many bytes, the summary cannot change much anymore
+VM_STREAM_MAX_BYTES = int(os.getenv("VM_STREAM_MAX_BYTES", str(4 * 1024 * 1024)))
+# stream bash output from `/run_bash_script_stream` (needs a server with that route, see VMClient)
+VM_STREAMING = os.getenv("VM_STREAMING", "false").lower() == "true"
+# run python snippets in a long-lived interpreter per tool set (`/kernel/{id}/execute`), so imports and variables persist
+VM_PYTHON_KERNEL = os.getenv("VM_PYTHON_KERNEL", "false").lower() == "true"
+_KERNEL_TIMEOUT_GRACE = 10  # seconds for the kernel server to report a snippet it stopped after its timeout
+_KERNEL_STOP_TIMEOUT = 10
+# stops kernels in the background, agents are closed on the event loop
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vm-client")
+
+
+class OutputBudget:
+    """
+    Keeps the head and the tail of a text fed in chunks within byte and line budgets, dropping the middle.
+    Memory stays bounded by the budgets, however much output is fed.
+    """
+
+    def __init__(self, max_bytes: int = VM_OUTPUT_MAX_BYTES, max_lines: int = VM_OUTPUT_MAX_LINES):
+        self.head_max_bytes, self.tail_max_bytes = max_bytes // 2, max_bytes - max_bytes // 2
+        self.head_max_lines, self.tail_max_lines = max_lines // 2, max_lines - max_lines // 2
+        self.total_bytes = 0
+        self.total_lines = 0
+        self._head: list[str] = []
+        self._head_bytes = 0
+        self._tail: deque[str] = deque()
+        self._tail_bytes = 0
+        self._partial = ""  # last line, until its newline arrives
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self._head_bytes + self._tail_bytes
+
+    def feed(self, text: str):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._add(line + "\n")
+
+    def _add(self, line: str):
+        size = len(line.encode("utf-8", errors="replace"))
+        self.total_bytes += size
+        self.total_lines += 1
+        if not self._tail and len(self._head) < self.head_max_lines and self._head_bytes + size <= self.head_max_bytes:
+            self._head.append(line)
+            self._head_bytes += size
+            return
+        if size > self.tail_max_bytes:
+            # a single huge line (minified json, progress bars), keep its end
+            line = "..." + line.encode("utf-8", errors="replace")[-self.tail_max_bytes + 3:].decode("utf-8", errors="ignore")
+            size = len(line.encode("utf-8"))
+        self._tail.append(line)
+        self._tail_bytes += size
+        while len(self._tail) > self.tail_max_lines or self._tail_bytes > self.tail_max_bytes:
+            self._tail_bytes -= len(self._tail.popleft().encode("utf-8", errors="replace"))
+
+    def summary(self) -> str:
+        if self._partial:
+            self._add(self._partial)
+            self._partial = ""
+        head, tail = "".join(self._head), "".join(self._tail)
+        if not self.truncated:
+            return head + tail
+        omitted_lines = self.total_lines - len(self._head) - len(self._tail)
+        omitted_bytes = self.total_bytes - self._head_bytes - self._tail_bytes
+        return f"{head}\n... [{omitted_lines} lines ({omitted_bytes} bytes) omitted] ...\n\n{tail}"
+
+
+def summarize_output(text: str, max_bytes: int = VM_OUTPUT_MAX_BYTES, max_lines: int = VM_OUTPUT_MAX_LINES) -> str:
+    """Head and tail of text within the budgets, text itself if it fits."""
+    if not isinstance(text, str) or (len(text) <= max_bytes // 4 and text.count("\n") < max_lines):
+        return text
+    budget = OutputBudget(max_bytes, max_lines)
+    budget.feed(text)
+    return budget.summary()
+
+
+def bound_result(result: dict) -> dict:
+    """Summarize the output and error texts of a VM server result, so they cannot flood the agent history."""
+    return {key: summarize_output(value) if key in ("output", "error", "message") else value for key, value in result.items()}
+
+
+class VMClient:
+    """
+    HTTP client for the http server running on a VM (`/run_python`, `/run_bash_script`, ...).
+
+    Connections are kept alive in a pool and reused across calls, so short commands do not pay for a new TCP
+    handshake each time. Timeouts are split into a short connect timeout, to fail fast on an unreachable VM,
+    and a per-call read timeout for the command itself. Retrying is left to the callers.
+
+    Command output returned to the agents is bounded, see OutputBudget. With VM_STREAMING, bash scripts are
+    streamed from `/run_bash_script_stream`, so reading stops early once VM_STREAM_MAX_BYTES arrived. The server
+    sends newline delimited JSON events `{"output": ...}` and/or `{"error": ...}` (stderr, unless merged into the
+    output), the last one with the `returncode`. Servers without the route (404/405) and failing streams fall
+    back to `/run_bash_script`.
+
+    In kernel mode, python snippets with a kernel id run in a persistent interpreter of that id on the VM
+    (`POST /kernel/{kernel_id}/execute`, see scripts/vm_kernel_server.py), so `import pandas` is paid once.
+    Servers without kernels (404) fall back to a fresh interpreter per snippet on `/run_python`. Owners of a
+    kernel id stop its kernel with `stop_kernel` once they are closed.
+    """
+
+    def __init__(self, server: str, pool_maxsize: int = VM_POOL_MAXSIZE, connect_timeout: float = VM_CONNECT_TIMEOUT):
+        self.server = server.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.streaming_supported = VM_STREAMING
+        self.kernel_supported = VM_PYTHON_KERNEL
+        self._kernel_ids: set[str] = set()  # kernels started through this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, path: str, data: str, read_timeout: float, **kwargs) -> requests.Response:
+        """POST a JSON encoded body to path."""
+        return self.session.post(
+            self.server + path,
+            headers={"Content-Type": "application/json"},
+            data=data,
+            timeout=(self.connect_timeout, read_timeout),
+            **kwargs,
+        )
+
+    def run_python(self, code: str, timeout: float = 300, kernel_id: str = None) -> dict:
+        if kernel_id is not None and self.kernel_supported:
+            response = self.post(f"/kernel/{kernel_id}/execute", data=json.dumps({"code": code, "timeout": timeout}),
+                                 read_timeout=timeout + _KERNEL_TIMEOUT_GRACE)
+            if response.status_code != 404:
+                self._kernel_ids.add(kernel_id)
+                response.raise_for_status()
+                return bound_result(response.json())
+            logger.info(f"{self.server} has no python kernels, falling back to /run_python")
+            self.kernel_supported = False
+
+        response = self.post("/run_python", data=json.dumps({"code": code}), read_timeout=timeout)
+        if response.status_code == 200:
+            return bound_result(response.json())
+        return bound_result({"status": "error", "message": "Failed to execute command.", "output": None, "error": response.json().get("error")})
+
+    def stop_kernel(self, kernel_id: str):
+        """Stop the kernel of kernel_id in the background, if one was started."""
+        if kernel_id not in self._kernel_ids:
+            return
+        self._kernel_ids.discard(kernel_id)
+        _background.submit(self._stop_kernel, kernel_id)
+
+    def _stop_kernel(self, kernel_id: str):
+        try:
+            self.session.delete(f"{self.server}/kernel/{kernel_id}", timeout=(self.connect_timeout, _KERNEL_STOP_TIMEOUT))
+        except requests.exceptions.RequestException as e:
+            # the server stops it after its idle timeout anyway
+            logger.warning(f"Failed to stop kernel {kernel_id} on {self.server}: {e!r}")
+
+    def run_bash_script(self, script: str, timeout: float = 300) -> dict:
+        """
+        Run a bash script, returns {"status", "output", "error", "returncode"}. Errors of the script (including
+        timeouts) are reported in the result, unexpected server errors are raised.
+        """
+        try:
+            result = self._stream_bash_script(script, timeout) if self.streaming_supported else None
+            if result is not None:
+                return result
+
+            response = self.post("/run_bash_script", data=json.dumps({"script": script, "timeout": timeout}), read_timeout=timeout)
+            if response.status_code == 200:
+                result = response.json()
+                logger.info(f"Bash script executed successfully with return code: {result.get('returncode', -1)}")
+                return bound_result(result)
+            elif response.status_code == 400:
+                return {
+                    "status": "error",
+                    "output": "",
+                    "error": summarize_output(f"Script execution failed with status code: {response.status_code}, error: {response.text}"),
+                    "returncode": -1
+                }
+            else:
+                logger.error(f"Failed to execute bash script. Status code: {response.status_code}, response: {response.text}")
+                raise Exception("Failed to execute bash script.")
+        except requests.exceptions.ReadTimeout:
+            logger.error("Bash script execution timed out")
+            return {
+                "status": "error",
+                "output": "",
+                "error": f"Script execution timed out after {timeout} seconds",
+                "returncode": -1
+            }
+
+    def _stream_bash_script(self, script: str, timeout: float) -> dict | None:
+        """Run a bash script on the streaming endpoint, None if the server does not have it or failed to stream."""
+        budget = OutputBudget()
+        error_budget = OutputBudget()
+        returncode = None
+        stopped_early = False
+        payload = json.dumps({"script": script, "timeout": timeout})
+        with self.post("/run_bash_script_stream", data=payload, read_timeout=timeout, stream=True) as response:
+            if response.status_code in (404, 405):
+                logger.info(f"{self.server} cannot stream bash scripts, falling back to /run_bash_script")
+                self.streaming_supported = False
+                return None
+            if response.status_code != 200:
+                logger.warning(f"Streaming the bash script failed (status code {response.status_code}), falling back to /run_bash_script")
+                return None
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("output"):
+                    budget.feed(event["output"])
+                if event.get("error"):
+                    error_budget.feed(event["error"])
+                if "returncode" in event:
+                    returncode = event["returncode"]
+                if budget.total_bytes + error_budget.total_bytes > VM_STREAM_MAX_BYTES:
+                    # leaving the block drops the connection, the server stops sending
+                    stopped_early = True
+                    break
+
+        output = budget.summary()
+        error = error_budget.summary()
+        if stopped_early:
+            output += f"\n[stopped reading after {budget.total_bytes} bytes of output, the script may still be running]"
+            return {"status": "error", "output": output, "error": "\n".join(filter(None, ["Output limit exceeded", error])), "returncode": -1}
+        logger.info(f"Bash script executed with return code: {returncode}")
+        return {
+            "status": "success" if returncode == 0 else "error",
+            "output": output,
+            "error": error,
+            "returncode": returncode if returncode is not None else -1,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+@lru_cache(maxsize=64)
+def get_vm_client(server: str) -> VMClient:
+    """The client of a VM server, shared by all sessions and tool sets talking to it."""
+    return VMClient(server)